@@ -0,0 +1,244 @@
+# <<< benchmark_facts_parsing.py >>>
+# Benchmarks the per-CIK work of fetch_sec_annual_financials.py on local companyfacts files:
+#   1. Parsing: full json.loads vs the selective parse_company_facts (time, peak Python memory).
+#   2. Processing: the original per-concept process_company_facts (kept below as the reference)
+#      vs the compiled-plan version, and whether both produce identical annual_results.
+#
+#   python3 ./benchmark_facts_parsing.py                       # bundled CIK*.json samples
+#   python3 ./benchmark_facts_parsing.py CIK0000320193.json --repeat 20
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import fetch_sec_annual_financials as fetcher
+from fetch_sec_annual_financials import DESIRED_TAGS, LOG_LEVEL, camel_to_snake, parse_date, safe_decimal, safe_int_or_bigint
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SAMPLES = ["CIK0000320193.json", "CIK0001652044.json", "CIK0001652044_facts.json"]
+
+# --- Reference (pre-plan) implementation, verbatim ---
+def reference_process_company_facts(cik, company_data):
+    """process_company_facts as it was before the compiled extraction plan (the 'before' side of the benchmark)."""
+    if not company_data or 'facts' not in company_data:
+        logging.debug(f"CIK {cik}: No 'facts' key found.")
+        return {}, None
+
+    company_name = company_data.get('entityName', 'N/A')
+    facts = company_data['facts']
+    annual_results = {} # { year: {'col_name_snake': value, ...}, ... }
+
+    # Iterate through desired *concepts* (keys of DESIRED_TAGS)
+    for key, possible_tags in DESIRED_TAGS.items():
+        db_col_snake = camel_to_snake(key)
+        found_tag_data = None
+        used_full_tag = None # Keep track of which tag was actually found and used
+
+        # Try each possible tag for the current concept (key)
+        for full_tag in possible_tags:
+            try:
+                # Basic check for valid tag format
+                if ':' not in full_tag:
+                    logging.warning(f"CIK {cik}: Invalid tag format '{full_tag}' in DESIRED_TAGS for key '{key}'")
+                    continue
+
+                taxonomy, tag_name = full_tag.split(':', 1) # Split only once
+
+                if taxonomy in facts and tag_name in facts[taxonomy]:
+                    # Found a usable tag for this concept!
+                    found_tag_data = facts[taxonomy][tag_name]
+                    used_full_tag = full_tag
+                    logging.debug(f"CIK {cik}: Found match for concept '{key}' using tag '{used_full_tag}'")
+                    break # Stop searching for tags for this concept
+            except ValueError:
+                 logging.warning(f"CIK {cik}: Malformed tag string '{full_tag}' in DESIRED_TAGS for key '{key}'")
+                 continue
+            except Exception as e:
+                 logging.error(f"CIK {cik}: Error checking tag {full_tag} for key {key}: {e}")
+                 continue
+
+        # If no tag was found for this concept after checking all possibilities
+        if not found_tag_data:
+            logging.debug(f"CIK {cik}: No usable tag found for concept '{key}' from list: {possible_tags}")
+            continue # Skip to the next concept in DESIRED_TAGS
+
+        # --- Process the data from the tag that was found ---
+        try:
+            units = found_tag_data.get('units')
+            if not units:
+                logging.debug(f"CIK {cik}: Tag '{used_full_tag}' (for concept '{key}') has no units.")
+                continue
+
+            # Determine unit key (USD, shares, USD/shares)
+            unit_key = None
+            is_share_metric = 'shares' in db_col_snake
+            is_eps_metric = 'eps' in db_col_snake
+
+            # Prioritize standard units
+            if is_share_metric and 'shares' in units: unit_key = 'shares'
+            elif is_eps_metric and 'USD/shares' in units: unit_key = 'USD/shares'
+            elif not is_share_metric and not is_eps_metric and 'USD' in units: unit_key = 'USD'
+            elif units: # Fallback: use the first unit found if primary is missing
+                first_unit = list(units.keys())[0]
+                unit_key = first_unit
+                expected_unit = 'shares' if is_share_metric else ('USD/shares' if is_eps_metric else 'USD')
+                logging.debug(f"CIK {cik}, Tag {used_full_tag}: Expected unit containing '{expected_unit}', using first available '{first_unit}'.")
+
+            if not unit_key or unit_key not in units:
+                logging.debug(f"CIK {cik}: Tag {used_full_tag} - No valid unit key found or unit key '{unit_key}' not in units {list(units.keys())}")
+                continue
+
+            unit_data = units[unit_key]
+            yearly_data_for_tag = {} # Stores best entry per year { year: {data} } for this specific tag
+
+            # --- Loop through individual data points for the found tag ---
+            for entry in unit_data:
+                 # Only consider FY (Fiscal Year) data points with a valid year
+                if entry.get('form') and entry.get('fp') == 'FY' and entry.get('fy') is not None:
+                    fy = entry.get('fy')
+                    filed_date = parse_date(entry.get('filed'))
+                    if not filed_date: continue # Skip if filing date is invalid
+
+                    # --- MODIFIED: Select best entry logic (Prefer 10-K/20-F, then latest filing) ---
+                    is_better_candidate = False
+                    current_best_str = ""
+                    if fy not in yearly_data_for_tag:
+                        is_better_candidate = True
+                    else:
+                        current_best = yearly_data_for_tag[fy]
+                        current_form = current_best.get('form')
+                        entry_form = entry.get('form')
+                        current_best_str = f"(Current best: Form={current_form}, Filed={current_best.get('filed_date')})"
+
+                        # Check if forms are primary annual reports (10-K or 20-F)
+                        entry_is_annual_report = entry_form in ('10-K', '20-F')
+                        current_is_annual_report = current_form in ('10-K', '20-F')
+
+                        if entry_is_annual_report and not current_is_annual_report:
+                            is_better_candidate = True # Prefer annual report over others
+                        elif entry_is_annual_report == current_is_annual_report:
+                            # If both same type (both annual OR both not), prefer latest filing
+                            if filed_date > current_best['filed_date']:
+                                is_better_candidate = True
+                        # Else (entry is not annual, current is) -> not better
+
+                    if is_better_candidate:
+                        # Parse value based on metric type
+                        value_to_store = safe_int_or_bigint(entry.get('val')) if is_share_metric else safe_decimal(entry.get('val'))
+
+                        if value_to_store is not None:
+                            yearly_data_for_tag[fy] = {
+                                'val': value_to_store,
+                                'filed_date': filed_date,
+                                'form': entry.get('form'), # Store the actual form (10-K, 20-F, etc.)
+                                'end_date': parse_date(entry.get('end'))
+                            }
+                            logging.debug(f"CIK {cik} FY {fy}: Stored '{key}' ({used_full_tag}) val={value_to_store} from {entry.get('form')} filed {filed_date}")
+                        else:
+                             logging.debug(f"CIK {cik} FY {fy}: Value parsing failed for '{key}' ({used_full_tag}) val='{entry.get('val')}'")
+
+
+            # --- Integrate best data for this tag/concept into the main results ---
+            for year, data in yearly_data_for_tag.items():
+                if year not in annual_results:
+                    annual_results[year] = {'cik': cik, 'year': year} # Initialize dict for the year
+
+                # Store the financial value using the snake_case column name
+                annual_results[year][db_col_snake] = data['val']
+
+                # --- MODIFIED: Update metadata (form, dates) logic ---
+                # Prioritize metadata from Annual Reports (10-K/20-F), then by latest filing date
+                update_metadata = False
+                if 'form' not in annual_results[year] or not annual_results[year].get('filed_date'):
+                    update_metadata = True # Always update if missing
+                else:
+                    current_meta_form = annual_results[year].get('form')
+                    current_meta_filed = annual_results[year].get('filed_date')
+                    tag_entry_form = data['form']
+                    tag_entry_filed = data['filed_date']
+
+                    entry_is_annual_report = tag_entry_form in ('10-K', '20-F')
+                    current_is_annual_report = current_meta_form in ('10-K', '20-F')
+
+                    if entry_is_annual_report and not current_is_annual_report:
+                        update_metadata = True # Prefer metadata from annual report form
+                    elif entry_is_annual_report == current_is_annual_report:
+                         # If both same type (both annual OR both not), prefer metadata from later filing
+                        if tag_entry_filed and current_meta_filed and tag_entry_filed > current_meta_filed:
+                            update_metadata = True
+                    # Else (entry not annual, current is) -> don't update
+
+                if update_metadata:
+                    logging.debug(f"CIK {cik} FY {year}: Updating metadata (form, dates) based on tag '{used_full_tag}'")
+                    annual_results[year]['form'] = data['form']
+                    annual_results[year]['filed_date'] = data['filed_date']
+                    annual_results[year]['period_end_date'] = data['end_date']
+
+        except Exception as e:
+            logging.error(f"Error processing data for tag {used_full_tag} (concept: {key}, col: {db_col_snake}) for CIK {cik}: {type(e).__name__} - {e}", exc_info=False)
+
+    # --- >>> END Loop through DESIRED_TAGS concepts <<< ---
+
+    # --- Add logging for final annual_results structure if debugging ---
+    if LOG_LEVEL <= logging.DEBUG:
+        for yr, data in annual_results.items():
+            logging.debug(f"CIK {cik} - Final data prepared for DB (Year {yr}): {data}")
+    # ---
+
+    return annual_results, company_name
+
+
+# --- Measurements ---
+def best_time(func, arg, repeat):
+    """Best wall time of `repeat` calls, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter(); func(arg); elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+def peak_memory(func, arg):
+    """Peak traced Python allocation during one call, in MB (the result is kept alive until the peak is read)."""
+    tracemalloc.start()
+    try: result = func(arg); _, peak = tracemalloc.get_traced_memory(); del result
+    finally: tracemalloc.stop()
+    return peak / 1e6
+
+def benchmark_file(path, repeat):
+    with open(path, 'rb') as f: raw = f.read()
+    name = os.path.basename(path)
+    try: full_doc = json.loads(raw)
+    except json.JSONDecodeError: print(f"{name:<28} {len(raw) / 1e6:>6.2f} MB  not a JSON document (skipped)"); return
+    selective_doc = fetcher.parse_company_facts(raw)
+
+    full_ms = best_time(json.loads, raw, repeat); selective_ms = best_time(fetcher.parse_company_facts, raw, repeat)
+    full_mb = peak_memory(json.loads, raw); selective_mb = peak_memory(fetcher.parse_company_facts, raw)
+    identical = fetcher.process_company_facts(0, full_doc) == fetcher.process_company_facts(0, selective_doc)
+    tag_count = sum(len(tags) for tags in full_doc.get('facts', {}).values())
+    kept_count = sum(len(tags) for tags in selective_doc.get('facts', {}).values())
+    print(f"{name:<28} {len(raw) / 1e6:>6.2f} MB  tags {kept_count:>4}/{tag_count:<5}"
+          f"  time {full_ms:>7.1f} -> {selective_ms:>6.1f} ms ({full_ms / selective_ms:>4.1f}x)"
+          f"  peak {full_mb:>6.1f} -> {selective_mb:>5.1f} MB ({full_mb / selective_mb:>4.1f}x)"
+          f"  annual_results {'identical' if identical else 'DIFFERENT'}")
+
+    reference_ms = best_time(lambda doc: reference_process_company_facts(0, doc), full_doc, repeat)
+    planned_ms = best_time(lambda doc: fetcher.process_company_facts(0, doc), full_doc, repeat)
+    reference_results = reference_process_company_facts(0, full_doc); planned_results = fetcher.process_company_facts(0, full_doc)
+    identical = repr(sorted(reference_results[0].items())) == repr(sorted(planned_results[0].items())) and reference_results[1] == planned_results[1]
+    print(f"{'':<28} process_company_facts  {reference_ms:>7.2f} -> {planned_ms:>6.2f} ms per CIK ({reference_ms / planned_ms:>4.1f}x)"
+          f"  {len(planned_results[0])} year(s), output {'byte-identical' if identical else 'DIFFERENT'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark full vs selective companyfacts parsing.")
+    parser.add_argument("files", nargs="*", help="companyfacts JSON files (default: bundled samples, or every CIK*.json here)")
+    parser.add_argument("--repeat", type=int, default=10, help="Timing repetitions per file (best is reported).")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING) # Keep the fetcher's INFO/DEBUG noise out of the table
+
+    files = args.files or [os.path.join(SCRIPT_DIR, f) for f in DEFAULT_SAMPLES if os.path.exists(os.path.join(SCRIPT_DIR, f))]
+    files = files or sorted(glob.glob(os.path.join(SCRIPT_DIR, "CIK*.json")))
+    for path in files: benchmark_file(path, max(1, args.repeat))
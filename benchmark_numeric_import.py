@@ -0,0 +1,187 @@
+# <<< benchmark_numeric_import.py >>>
+# Benchmarks the row-building step of importSECData_AllForms.py (num.txt chunk -> insert tuples,
+# no database involved) on a synthetic quarter:
+#   1. The original itertuples/per-row Decimal build_numeric_rows (kept below as the reference).
+#   2. The columnar build_numeric_rows (join on adsh, whole-column dates/values, one zip pass), with
+#      CalculatedFreeCashFlow derived once per file by FcfAccumulator.
+# Both run on the same chunks; rows/sec is measured over num.txt input rows and the fact rows are
+# compared row by row (values compared as decimals, since the columnar path passes exact floats through).
+# FCF rows differ by design (the reference only pairs CFO/CapEx within a chunk), so only their counts are shown.
+#
+#   python3 ./benchmark_numeric_import.py                       # synthetic 5M-row num.txt
+#   python3 ./benchmark_numeric_import.py --rows 500000
+#   python3 ./benchmark_numeric_import.py --data-dir ./2024q4   # a real sub.txt/num.txt pair
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import importSECData_AllForms as importer
+from importSECData_AllForms import CAPEX_TAGS, CFO_TAGS, CHUNK_SIZE, FCF_CALCULATION_METHOD, MAX_DECIMAL_PLACES, NUMERIC_COLUMNS, TARGET_UOM, format_date, parse_decimal
+
+DEFAULT_ROWS = 5_000_000
+DEFAULT_SUBMISSIONS = 8000
+FCF_TAGS = sorted(CFO_TAGS | CAPEX_TAGS)
+SYNTHETIC_TAGS = FCF_TAGS + [f"SyntheticConcept{i}" for i in range(400)]
+SYNTHETIC_TAG_WEIGHTS = np.array([0.1 / len(FCF_TAGS)] * len(FCF_TAGS) + [0.9 / 400] * 400) # 10% CFO/CapEx rows so FCF rows get built
+
+# --- Reference (pre-columnar) implementation, verbatim ---
+def reference_build_numeric_rows(chunk_df, sub_map):
+    """build_numeric_rows as it was before the columnar rewrite (the 'before' side of the benchmark)."""
+    logger = logging.getLogger(__name__)
+    logger.debug(f"Processing chunk of {len(chunk_df)} numeric rows...")
+    rows_to_insert = []
+
+    relevant_chunk = chunk_df[chunk_df['adsh'].isin(sub_map.keys())].copy()
+    relevant_chunk = relevant_chunk[
+        (relevant_chunk['qtrs'].isin([0, 1, 4])) &
+        (relevant_chunk['uom'] == TARGET_UOM)
+    ].copy()
+    logger.debug(f"Chunk filtered to {len(relevant_chunk)} relevant rows.")
+    if relevant_chunk.empty: return []
+
+    fcf_candidates = {}
+    annual_rows = relevant_chunk[relevant_chunk['qtrs'] == 4]
+    for row in annual_rows.itertuples(index=False):
+        adsh = row.adsh; tag = row.tag; ddate_str = format_date(row.ddate)
+        if not ddate_str: continue
+        try:
+            year = int(ddate_str[:4]); val = parse_decimal(row.value);
+            if val is None: continue
+            key = (adsh, year)
+            if tag in CFO_TAGS: fcf_candidates.setdefault(key, {})['cfo'] = val
+            elif tag in CAPEX_TAGS: fcf_candidates.setdefault(key, {})['capex'] = val
+        except Exception as e: logger.warning(f"Error processing row during FCF collect: {row}. Error: {e}"); continue
+
+    for row in relevant_chunk.itertuples(index=False):
+        adsh = row.adsh; sub_info = sub_map.get(adsh);
+        if not sub_info: continue
+        ddate_str = format_date(row.ddate);
+        if not ddate_str: continue
+        try:
+            value = parse_decimal(row.value);
+            if value is None: continue
+            row_data = { "adsh": adsh, "tag": row.tag, "version": row.version, "ddate": ddate_str, "qtrs": row.qtrs, "uom": row.uom, "value": value, "coreg": getattr(row, 'coreg', None), "footnote": getattr(row, 'footnote', None), "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
+            row_tuple = tuple(row_data.get(col) if not pd.isna(row_data.get(col)) else None for col in NUMERIC_COLUMNS)
+            rows_to_insert.append(row_tuple)
+        except Exception as e: logger.warning(f"Error preparing row for insert: {row}. Error: {e}"); continue
+
+    fcf_rows_to_insert = []
+    for (adsh, year), values in fcf_candidates.items():
+        if 'cfo' in values and 'capex' in values:
+            try:
+                fcf_value = FCF_CALCULATION_METHOD(values['cfo'], values['capex'])
+                fcf_value_sql = fcf_value.quantize(Decimal('1e-' + str(MAX_DECIMAL_PLACES)))
+                logger.info(f"[{adsh}-{year}] Calculated FCF: {values['cfo']} + {values['capex']} = {fcf_value_sql}")
+                sub_info = sub_map.get(adsh);
+                if sub_info:
+                    accurate_ddate = f"{year}-12-31"
+                    fcf_row_data = { "adsh": adsh, "tag": "CalculatedFreeCashFlow", "version": "custom/internal", "ddate": accurate_ddate, "qtrs": 4, "uom": TARGET_UOM, "value": fcf_value_sql, "coreg": None, "footnote": "Calculated as CFO + CapEx", "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
+                    fcf_tuple = tuple(fcf_row_data.get(col) if not pd.isna(fcf_row_data.get(col)) else None for col in NUMERIC_COLUMNS)
+                    fcf_rows_to_insert.append(fcf_tuple)
+            except Exception as e: logger.error(f"Error calculating/preparing FCF for {adsh}-{year}: {e}")
+
+    return rows_to_insert + fcf_rows_to_insert
+
+# --- Synthetic Data ---
+def write_synthetic_quarter(data_dir, rows, submissions, seed):
+    """Writes a sub.txt/num.txt pair shaped like an SEC financial statement data set quarter."""
+    rng = np.random.default_rng(seed)
+    adsh = np.array([f"{1000000 + i:010d}-24-{i:06d}" for i in range(submissions)])
+    periods = np.array([20231231, 20240331, 20240630, 20240930])
+    sub_df = pd.DataFrame({
+        "adsh": adsh, "cik": rng.integers(1000, 2000000, submissions), "name": [f"COMPANY {i}" for i in range(submissions)],
+        "form": rng.choice(["10-K", "10-Q", "8-K", "20-F"], submissions, p=[0.2, 0.6, 0.15, 0.05]),
+        "period": rng.choice(periods, submissions), "fy": rng.choice([2023, 2024], submissions),
+        "fp": rng.choice(["FY", "Q1", "Q2", "Q3"], submissions), "filed": 20241105,
+    })
+    sub_df.loc[rng.random(submissions) < 0.01, "fy"] = np.nan
+    sub_df.to_csv(os.path.join(data_dir, "sub.txt"), sep="\t", index=False, float_format="%.0f")
+
+    # ~3% of rows reference filings missing from sub.txt, like amendments filed in other quarters
+    row_adsh = np.where(rng.random(rows) < 0.03, "0009999999-24-000000", adsh[rng.integers(0, submissions, rows)])
+    magnitude = 10.0 ** rng.integers(0, 12, rows)
+    value = np.round(rng.standard_normal(rows) * magnitude)
+    per_share = rng.random(rows) < 0.05
+    value[per_share] = np.round(rng.standard_normal(per_share.sum()) * 10, 2)
+    value[rng.random(rows) < 0.002] = rng.random() / 3 # more than 4 decimals -> parse_decimal path
+    value[rng.random(rows) < 0.005] = np.nan
+    num_df = pd.DataFrame({
+        "adsh": row_adsh, "tag": rng.choice(SYNTHETIC_TAGS, rows, p=SYNTHETIC_TAG_WEIGHTS), "version": rng.choice(["us-gaap/2023", "us-gaap/2024", "custom"], rows),
+        "coreg": np.where(rng.random(rows) < 0.02, "SubsidiaryMember", ""), "ddate": rng.choice(periods, rows),
+        "qtrs": rng.choice([0, 1, 2, 3, 4], rows, p=[0.35, 0.25, 0.1, 0.1, 0.2]),
+        "uom": rng.choice(["USD", "shares", "pure"], rows, p=[0.85, 0.1, 0.05]), "value": value,
+        "footnote": np.where(rng.random(rows) < 0.001, "See note 5", ""),
+    })
+    num_df.to_csv(os.path.join(data_dir, "num.txt"), sep="\t", index=False, float_format="%.10g")
+
+# --- Benchmark ---
+def same_rows(reference_rows, columnar_rows):
+    """Row-by-row equality of the fact rows; value is compared as a decimal (float/int pass-through vs quantized Decimal)."""
+    reference_rows = [row for row in reference_rows if row[1] != "CalculatedFreeCashFlow"]
+    if len(reference_rows) != len(columnar_rows): return False
+    value_index = NUMERIC_COLUMNS.index("value")
+    for ref, new in zip(reference_rows, columnar_rows):
+        ref_value, new_value = ref[value_index], new[value_index]
+        if (ref_value is None) != (new_value is None): return False
+        if ref_value is not None and Decimal(str(new_value)) != ref_value: return False
+        if ref[:value_index] + ref[value_index + 1:] != new[:value_index] + new[value_index + 1:]: return False
+    return True
+
+def run_benchmark(data_dir, chunk_size, skip_reference):
+    sub_df = importer.load_submissions(os.path.join(data_dir, "sub.txt"))
+    sub_map = sub_df.set_index('adsh').to_dict('index')
+    sub_frame = importer.build_submission_frame(sub_df)
+    input_rows = output_rows = reference_fcf_rows = 0; read_seconds = reference_seconds = columnar_seconds = 0.0; mismatched_chunks = 0
+    fcf = importer.FcfAccumulator(sub_frame)
+
+    start = time.perf_counter()
+    for chunk in importer.read_num_chunks(os.path.join(data_dir, "num.txt"), chunk_size):
+        read_seconds += time.perf_counter() - start
+        t0 = time.perf_counter(); columnar_rows = importer.build_numeric_rows(chunk, sub_frame, fcf); columnar_seconds += time.perf_counter() - t0
+        if not skip_reference:
+            t0 = time.perf_counter(); reference_rows = reference_build_numeric_rows(chunk, sub_map); reference_seconds += time.perf_counter() - t0
+            if not same_rows(reference_rows, columnar_rows): mismatched_chunks += 1
+            reference_fcf_rows += sum(1 for row in reference_rows if row[1] == "CalculatedFreeCashFlow")
+        input_rows += len(chunk); output_rows += len(columnar_rows)
+        start = time.perf_counter()
+    t0 = time.perf_counter(); fcf_rows = fcf.rows(); columnar_seconds += time.perf_counter() - t0
+    output_rows += len(fcf_rows)
+
+    print(f"num.txt rows: {input_rows:,}  insert tuples: {output_rows:,}  chunk size: {chunk_size:,}")
+    print(f"  read_csv                 {read_seconds:8.2f}s  {input_rows / read_seconds:12,.0f} rows/s")
+    if not skip_reference:
+        print(f"  reference (itertuples)   {reference_seconds:8.2f}s  {input_rows / reference_seconds:12,.0f} rows/s")
+    print(f"  columnar                 {columnar_seconds:8.2f}s  {input_rows / columnar_seconds:12,.0f} rows/s")
+    if not skip_reference:
+        print(f"  speedup: {reference_seconds / columnar_seconds:.1f}x  identical fact rows: {'yes' if mismatched_chunks == 0 else f'NO ({mismatched_chunks} chunks differ)'}")
+        print(f"  FCF rows: {reference_fcf_rows:,} per-chunk (reference), {len(fcf_rows):,} whole-file")
+    return mismatched_chunks == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reference vs columnar num.txt row building.")
+    parser.add_argument("--data-dir", help="Directory with a real sub.txt/num.txt (default: generate a synthetic quarter)")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help=f"Synthetic num.txt rows. Default: {DEFAULT_ROWS:,}")
+    parser.add_argument("--submissions", type=int, default=DEFAULT_SUBMISSIONS, help=f"Synthetic sub.txt filings. Default: {DEFAULT_SUBMISSIONS}")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"num.txt chunk size. Default: {CHUNK_SIZE}")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic quarter.")
+    parser.add_argument("--skip-reference", action="store_true", help="Only time the columnar path.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.data_dir: ok = run_benchmark(args.data_dir, args.chunk_size, args.skip_reference)
+    else:
+        with tempfile.TemporaryDirectory(prefix="sec_num_bench_") as data_dir:
+            t0 = time.perf_counter(); write_synthetic_quarter(data_dir, args.rows, args.submissions, args.seed)
+            print(f"Generated synthetic quarter in {time.perf_counter() - t0:.1f}s ({data_dir})")
+            ok = run_benchmark(data_dir, args.chunk_size, args.skip_reference)
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# <<< benchmark_period_pivot.py >>>
+# Benchmarks the pivot step of transformSECToPeriods.transform_data (long facts -> one row per period,
+# no database involved) on synthetic fetch_data_for_ciks output:
+#   1. pivot_facts_pandas: the original pivot_table(..., aggfunc='last') over the nine context columns.
+#   2. pivot_facts: the array kernel (factorised period/tag codes scattered into a 2-D NumPy array).
+# Both the pivoted frames and the full transform_data outputs are checked for exact equality.
+#
+#   python3 ./benchmark_period_pivot.py                          # 2M facts, 100-CIK batches
+#   python3 ./benchmark_period_pivot.py --facts 200000 --ciks 20 --repeat 5
+# Quote results together with the pandas/numpy versions printed in the header; small sizes vary from run to run.
+
+import argparse
+import datetime
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import transformSECToPeriods as transform
+from transformSECToPeriods import CIK_BATCH_SIZE
+from sec_tag_map import TAG_MAP
+
+DEFAULT_FACTS = 2_000_000
+DEFAULT_REPEAT = 3
+MAPPED_TAGS = sorted(set(tag for tags in TAG_MAP.values() for tag in tags)) + ['CalculatedFreeCashFlow']
+
+# --- Synthetic Data ---
+def synthetic_facts(facts: int, ciks: int, seed: int) -> pd.DataFrame:
+    """Rows shaped like fetch_data_for_ciks' result (dictionary cursor -> DataFrame), ordered by cik, ddate, qtrs.
+    Several filings per CIK repeat earlier periods (comparatives) and ~2% of facts repeat a tag with a new value."""
+    rng = np.random.default_rng(seed)
+    year_ends = [datetime.date(y, 12, 31) for y in range(2009, 2025)]
+    quarter_ends = [datetime.date(y, m, d) for y in range(2009, 2025) for m, d in ((3, 31), (6, 30), (9, 30), (12, 31))]
+    cik = rng.integers(1000, 1000 + ciks, facts)
+    filing_year = rng.integers(2010, 2025, facts)
+    qtrs = rng.choice([0, 1, 4], facts, p=[0.4, 0.3, 0.3])
+    ddate = np.where(qtrs == 4, np.array(year_ends, dtype=object)[filing_year - 2010 - rng.integers(0, 2, facts) + 1],
+                     np.array(quarter_ends, dtype=object)[(filing_year - 2009) * 4 - rng.integers(1, 5, facts)])
+    df = pd.DataFrame({
+        "cik": cik, "adsh": [f"{c:010d}-{y % 100:02d}-{n:06d}" for c, y, n in zip(cik, filing_year, rng.integers(0, 3, facts))],
+        "form": np.where(qtrs == 4, "10-K", "10-Q"), "period": [datetime.date(y, 12, 31) for y in filing_year],
+        "fy": filing_year, "fp": np.where(qtrs == 4, "FY", rng.choice(["Q1", "Q2", "Q3"], facts)),
+        "ddate": ddate, "qtrs": qtrs, "tag": rng.choice(MAPPED_TAGS, facts), "version": "us-gaap/2023", "uom": "USD",
+        "value": np.round(rng.standard_normal(facts) * 10.0 ** rng.integers(3, 11, facts), 2),
+        "updated_at": datetime.datetime(2026, 1, 1),
+    })
+    df.loc[rng.random(facts) < 0.01, "fy"] = np.nan # sub.txt without fy: pivot_table drops these groups
+    df.loc[rng.random(facts) < 0.005, "value"] = np.nan
+    return df.sort_values(["cik", "ddate", "qtrs"], kind="stable").reset_index(drop=True)
+
+# --- Benchmark ---
+def timed(function, *args, repeat: int):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); result = function(*args); elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def run_benchmark(raw_df: pd.DataFrame, repeat: int) -> bool:
+    facts = raw_df.copy(); facts['value'] = pd.to_numeric(facts['value'], errors='coerce'); facts = facts.dropna(subset=['value']) # As transform_data
+    reference, reference_seconds = timed(transform.pivot_facts_pandas, facts, repeat=repeat)
+    kernel, kernel_seconds = timed(transform.pivot_facts, facts, repeat=repeat)
+    try: pd.testing.assert_frame_equal(kernel, reference); same_pivot = True
+    except AssertionError as e: same_pivot = False; print(f"Pivot mismatch: {e}")
+    try: pd.testing.assert_frame_equal(transform.transform_data(raw_df.copy()), transform.transform_data(raw_df.copy(), pivot=transform.pivot_facts_pandas)); same_output = True
+    except AssertionError as e: same_output = False; print(f"transform_data mismatch: {e}")
+
+    print(f"facts: {len(raw_df):,}  CIKs: {raw_df['cik'].nunique():,}  periods: {len(reference):,}  tag columns: {reference.shape[1] - len(transform.PIVOT_INDEX_COLUMNS)}  (best of {repeat})")
+    print(f"pandas {pd.__version__}, numpy {np.__version__} -- the speedup depends on both and on the machine")
+    print(f"  pivot_table (reference)  {reference_seconds:8.3f}s  {len(facts) / reference_seconds:12,.0f} facts/s")
+    print(f"  array kernel             {kernel_seconds:8.3f}s  {len(facts) / kernel_seconds:12,.0f} facts/s")
+    print(f"  speedup: {reference_seconds / kernel_seconds:.1f}x  identical pivot: {'yes' if same_pivot else 'NO'}  identical transform_data output: {'yes' if same_output else 'NO'}")
+    return same_pivot and same_output
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pivot_table vs the array pivot kernel of transformSECToPeriods.")
+    parser.add_argument("--facts", type=int, default=DEFAULT_FACTS, help=f"Synthetic fact rows. Default: {DEFAULT_FACTS:,}")
+    parser.add_argument("--ciks", type=int, default=CIK_BATCH_SIZE, help=f"Distinct CIKs (one transform batch). Default: {CIK_BATCH_SIZE}")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Timed runs per pivot (best is reported). Default: {DEFAULT_REPEAT}")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic facts.")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING) # transform_data logs every step at INFO
+
+    t0 = time.perf_counter(); raw_df = synthetic_facts(args.facts, args.ciks, args.seed)
+    print(f"Generated {len(raw_df):,} synthetic facts in {time.perf_counter() - t0:.1f}s")
+    raise SystemExit(0 if run_benchmark(raw_df, args.repeat) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 
 import os
 import csv
+import io
+import argparse
+import zipfile # FSDS quarter archives can be read in place
+from contextlib import contextmanager
 from datetime import datetime
 import re # For checking folder pattern
+import pandas as pd # Only used for the --parquet path
 
 # --- Configuration ---
 BASE_DATA_DIR = "/media/devmon/Kay/My Documents/workspace/Stock/us_data/"
 TARGET_CIK = 1652044 # Example CIK (Meta/Facebook) - CHANGE AS NEEDED
 OUTPUT_CSV_FILE = f"sec_numeric_extract_cik_{TARGET_CIK}.csv"
 FOLDER_PATTERN = re.compile(r"^\d{4}q[1-4]$") # Regex to match YYYYqN pattern
+ARCHIVE_PATTERN = re.compile(r"^\d{4}q[1-4]\.zip$") # Regex to match YYYYqN.zip archives
 
 # --- Helper Functions ---
 def format_date_sec(date_str):
@@ -42,22 +48,80 @@ def safe_decimal(value):
     except (ValueError, TypeError):
         return None
 
+def quarter_name(path):
+    """YYYYqN label of a quarter folder or archive."""
+    return os.path.basename(path)[:-len(".zip")] if path.endswith(".zip") else os.path.basename(path)
+
+def archive_member_name(archive, file_name):
+    """Name of sub.txt/num.txt inside an archive (top level or one folder down), or None."""
+    return next((name for name in archive.namelist() if os.path.basename(name) == file_name), None)
+
+def quarter_has_file(quarter_path, file_name):
+    """True if the folder or archive contains file_name."""
+    if not quarter_path.endswith(".zip"): return os.path.exists(os.path.join(quarter_path, file_name))
+    with zipfile.ZipFile(quarter_path) as archive: return archive_member_name(archive, file_name) is not None
+
+@contextmanager
+def open_quarter_file(quarter_path, file_name):
+    """Opens sub.txt/num.txt as text, from a YYYYqN folder or streamed straight out of a YYYYqN.zip."""
+    if not quarter_path.endswith(".zip"):
+        with open(os.path.join(quarter_path, file_name), 'r', encoding='utf-8') as f: yield f
+        return
+    with zipfile.ZipFile(quarter_path) as archive, archive.open(archive_member_name(archive, file_name)) as member:
+        yield io.TextIOWrapper(member, encoding='utf-8', newline='')
+
+def extract_from_parquet(root, cik):
+    """Same rows as the text scan below, read from an fsds_parquet.py dataset with the CIK pushed down
+    (one pass over all converted quarters). A filing seen in several quarters is taken from the first."""
+    import fsds_parquet # Optional dependency (pyarrow); only needed for --parquet
+    subs = fsds_parquet.read_sub(root, ciks=[cik], columns=['adsh', 'form', 'period', 'fy', 'fp', 'quarter'])
+    subs = subs.sort_values('quarter', kind='stable').drop_duplicates('adsh')
+    nums = fsds_parquet.read_num(root, ciks=[cik], columns=['adsh', 'tag', 'version', 'ddate', 'qtrs', 'uom', 'value', 'coreg', 'footnote', 'quarter'])
+    nums = nums.merge(subs, on=['adsh', 'quarter'], how='inner').sort_values('quarter', kind='stable')
+    required = nums[['adsh', 'tag', 'version', 'ddate', 'qtrs', 'uom']].notna().all(axis=1)
+    print(f"  {len(subs)} submission(s), {len(nums)} numeric row(s) for CIK {cik} in {subs['quarter'].nunique()} quarter(s); skipping {int((~required).sum())} row(s) missing required fields.")
+    nums = nums[required]
+    as_text = lambda v: None if pd.isna(v) or v == '' else v
+    return [{
+        'adsh': r.adsh, 'tag': r.tag, 'version': r.version, 'ddate': r.ddate.strftime('%Y-%m-%d'), 'qtrs': int(r.qtrs), 'uom': r.uom,
+        'value': None if pd.isna(r.value) else float(r.value), 'coreg': as_text(r.coreg), 'footnote': as_text(r.footnote),
+        'cik': cik, 'form': as_text(r.form), 'period': None if pd.isna(r.period) else r.period.strftime('%Y-%m-%d'),
+        'fy': None if pd.isna(r.fy) else int(r.fy), 'fp': as_text(r.fp),
+    } for r in nums.itertuples(index=False)]
+
 # --- Main Script ---
 
+arg_parser = argparse.ArgumentParser(description=f"Extract sec_numeric_data rows for CIK {TARGET_CIK} from FSDS quarter folders or zip archives.")
+arg_parser.add_argument("--base-dir", default=BASE_DATA_DIR, help=f"Directory holding YYYYqN folders and/or YYYYqN.zip archives. Default: {BASE_DATA_DIR}")
+arg_parser.add_argument("--archive", action="append", help="Read only this quarter zip (repeatable); skips scanning --base-dir")
+arg_parser.add_argument("--parquet", help="Read all quarters from an fsds_parquet.py dataset root instead of the text files (requires pyarrow)")
+args = arg_parser.parse_args()
+
 print(f"Starting data extraction for CIK: {TARGET_CIK}")
-print(f"Base directory: {BASE_DATA_DIR}")
+print(f"Base directory: {args.base_dir}")
 
-# 1. List potential quarterly folders
-all_items = os.listdir(BASE_DATA_DIR)
-quarterly_folders = sorted([
-    os.path.join(BASE_DATA_DIR, item)
-    for item in all_items
-    if os.path.isdir(os.path.join(BASE_DATA_DIR, item)) and FOLDER_PATTERN.match(item)
-])
+# 1. List potential quarterly folders (or archives; a folder wins over a zip of the same quarter)
+if args.parquet:
+    quarterly_folders = [] # Rows come from the Parquet dataset below
+elif args.archive:
+    quarterly_folders = sorted(args.archive, key=quarter_name)
+else:
+    all_items = os.listdir(args.base_dir)
+    folder_items = {
+        item: os.path.join(args.base_dir, item)
+        for item in all_items
+        if os.path.isdir(os.path.join(args.base_dir, item)) and FOLDER_PATTERN.match(item)
+    }
+    archive_items = {
+        quarter_name(item): os.path.join(args.base_dir, item)
+        for item in all_items
+        if os.path.isfile(os.path.join(args.base_dir, item)) and ARCHIVE_PATTERN.match(item)
+    }
+    quarterly_folders = [path for _, path in sorted({**archive_items, **folder_items}.items())]
 
 print("\nFound Quarterly Folders:")
-if not quarterly_folders:
-    print("  No folders matching pattern YYYYqN found. Exiting.")
+if not quarterly_folders and not args.parquet:
+    print("  No folders or archives matching pattern YYYYqN found. Exiting.")
     exit()
 
 for i, folder in enumerate(quarterly_folders):
@@ -77,6 +141,9 @@ print(f"\nSelected folders to process: {[os.path.basename(f) for f in selected_f
 
 all_extracted_data = []
 processed_adsh = set() # Keep track of adsh already processed from sub.txt
+if args.parquet:
+    print(f"\nReading Parquet dataset: {args.parquet}")
+    all_extracted_data = extract_from_parquet(args.parquet, TARGET_CIK)
 
 # 2. & 3. Read files and process data
 for folder_path in selected_folders:
@@ -87,18 +154,22 @@ for folder_path in selected_folders:
     num_file_path = os.path.join(folder_path, "num.txt")
 
     # Check if files exist
-    if not os.path.exists(sub_file_path):
-        print(f"  WARNING: sub.txt not found in {folder_name}. Skipping folder.")
-        continue
-    if not os.path.exists(num_file_path):
-        print(f"  WARNING: num.txt not found in {folder_name}. Skipping folder.")
+    try:
+        if not quarter_has_file(folder_path, "sub.txt"):
+            print(f"  WARNING: sub.txt not found in {folder_name}. Skipping folder.")
+            continue
+        if not quarter_has_file(folder_path, "num.txt"):
+            print(f"  WARNING: num.txt not found in {folder_name}. Skipping folder.")
+            continue
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"  ERROR opening {folder_name}: {e}. Skipping folder.")
         continue
 
     # Read relevant submission data for the target CIK
     print(f"  Reading {sub_file_path}...")
     sub_data_for_cik = {} # Store adsh -> {metadata} for target CIK in this folder
     try:
-        with open(sub_file_path, 'r', encoding='utf-8') as f_sub:
+        with open_quarter_file(folder_path, "sub.txt") as f_sub:
             reader = csv.reader(f_sub, delimiter='\t')
             header_sub = next(reader) # Read header
             # Find column indices (robust to order changes)
@@ -143,7 +214,7 @@ for folder_path in selected_folders:
     print(f"  Reading {num_file_path}...")
     rows_added_from_folder = 0
     try:
-        with open(num_file_path, 'r', encoding='utf-8') as f_num:
+        with open_quarter_file(folder_path, "num.txt") as f_num:
             reader = csv.reader(f_num, delimiter='\t')
             header_num = next(reader)
             try:
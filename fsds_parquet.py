@@ -0,0 +1,224 @@
+# <<< fsds_parquet.py >>>
+# Columnar Parquet staging layer for the SEC Financial Statement Data Sets (FSDS).
+# Converts each quarter's sub.txt/num.txt (from a YYYYqN folder or YYYYqN.zip) into typed, zstd-compressed
+# Parquet, hive-partitioned by quarter:
+#
+#   <root>/sub/quarter=2024q2/part-0.parquet
+#   <root>/num/quarter=2024q2/part-0.parquet   (adsh/tag/version/uom dictionary-encoded; cik and fy from
+#                                               sub.txt denormalized onto every row; rows clustered by cik)
+#
+# and offers a small reader API (read_num / read_sub / iter_num_batches / iter_tag_filtered_num_batches) with predicate pushdown on
+# quarter/cik/tag/fy, used by importSECData_AllForms.py (--parquet) and extract_sec_data.py (--parquet).
+#
+#   python3 fsds_parquet.py convert --out ./fsds_parquet ./data/2024q2.zip "./data/201[2-8]q?"
+#   python3 fsds_parquet.py query --root ./fsds_parquet --cik 320193 --tag Revenues --fy 2023 --csv apple.csv
+#
+# Requires pyarrow (pip install pyarrow); the importers only import this module when --parquet is used.
+
+import argparse
+import glob
+import logging
+import os
+import time
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- Configuration ---
+CSV_CHUNK_SIZE = 500000 # num.txt rows per read_csv chunk during conversion
+ROW_GROUP_SIZE = 65536 # Small row groups keep the cik min/max statistics selective
+COMPRESSION = 'zstd'
+PART_FILE = "part-0.parquet"
+METADATA_PREFIX = b"fsds."
+
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+SUB_SCHEMA = pa.schema([
+    ("adsh", pa.string()), ("cik", pa.int64()), ("name", pa.string()), ("sic", pa.int32()),
+    ("countryba", DICT_STRING), ("stprba", DICT_STRING), ("form", DICT_STRING),
+    ("period", pa.date32()), ("fye", pa.string()), ("fy", pa.int16()), ("fp", DICT_STRING),
+    ("filed", pa.date32()), ("accepted", pa.string()), ("prevrpt", pa.int8()), ("afs", DICT_STRING),
+    ("wksi", pa.int8()), ("nciks", pa.int32()), ("instance", pa.string()),
+])
+NUM_SCHEMA = pa.schema([
+    ("adsh", DICT_STRING), ("tag", DICT_STRING), ("version", DICT_STRING), ("coreg", pa.string()),
+    ("ddate", pa.date32()), ("qtrs", pa.int32()), ("uom", DICT_STRING), ("value", pa.float64()),
+    ("footnote", pa.string()), ("cik", pa.int64()), ("fy", pa.int16()),
+])
+
+logger = logging.getLogger("fsds_parquet")
+
+# --- Paths ---
+def quarter_label(path: str) -> str:
+    """YYYYqN label of a quarter folder or archive (the basename without .zip)."""
+    name = os.path.basename(os.path.normpath(path))
+    return name[:-len(".zip")] if name.lower().endswith(".zip") else name
+
+def partition_path(root: str, table: str, quarter: str) -> str:
+    return os.path.join(root, table, f"quarter={quarter}", PART_FILE)
+
+def quarter_files(root: str, quarter: str) -> Dict[str, str]:
+    """{'sub': path, 'num': path} of one converted quarter."""
+    return {table: partition_path(root, table, quarter) for table in ('sub', 'num')}
+
+def available_quarters(root: str) -> List[str]:
+    return sorted(os.path.basename(p).split("=", 1)[1] for p in glob.glob(os.path.join(root, "num", "quarter=*"))
+                  if os.path.exists(os.path.join(p, PART_FILE)))
+
+# --- Conversion ---
+def open_source_file(source: str, file_name: str):
+    """Binary handle of sub.txt/num.txt in a quarter folder or inside a quarter zip."""
+    if not source.lower().endswith(".zip"): return open(os.path.join(source, file_name), 'rb')
+    with zipfile.ZipFile(source) as archive:
+        member = next((name for name in archive.namelist() if os.path.basename(name) == file_name), None)
+        if member is None: raise FileNotFoundError(f"{file_name} not found in archive {source}")
+        return archive.open(member)
+
+def yyyymmdd_dates(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values, format='%Y%m%d', errors='coerce')
+
+def to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """DataFrame -> Table with exactly `schema` (missing columns become nulls)."""
+    arrays = []
+    for field in schema:
+        plain_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        array = pa.array(df[field.name], from_pandas=True) if field.name in df.columns else pa.nulls(len(df), plain_type)
+        if not array.type.equals(plain_type): array = array.cast(plain_type)
+        arrays.append(array.dictionary_encode() if pa.types.is_dictionary(field.type) else array)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def write_table(table: pa.Table, path: str, metadata: Dict[str, str]) -> None:
+    """Writes atomically (temp file + rename) so a crashed conversion never leaves a half partition."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **{METADATA_PREFIX + k.encode(): str(v).encode() for k, v in metadata.items()}})
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE, use_dictionary=True, write_statistics=True)
+    os.replace(tmp_path, path)
+
+def convert_quarter(source: str, root: str, quarter: Optional[str] = None) -> Dict[str, Any]:
+    """Converts one quarter folder/zip into <root>/{sub,num}/quarter=<quarter>/. Returns row counts and timing."""
+    quarter = quarter or quarter_label(source)
+    start = time.time()
+    with open_source_file(source, "sub.txt") as f:
+        sub_df = pd.read_csv(f, sep='\t', dtype=str, keep_default_na=False, na_values=[''], encoding='utf-8', on_bad_lines='warn')
+    for col in ('cik', 'sic', 'fy', 'prevrpt', 'wksi', 'nciks'):
+        if col in sub_df.columns: sub_df[col] = pd.to_numeric(sub_df[col], errors='coerce').astype('Int64')
+    for col in ('period', 'filed'):
+        if col in sub_df.columns: sub_df[col] = yyyymmdd_dates(sub_df[col])
+    sub_table = to_table(sub_df, SUB_SCHEMA)
+    sub_keys = sub_df[['adsh', 'cik', 'fy']].drop_duplicates('adsh').set_index('adsh')
+
+    num_tables = []; bad_dates = 0
+    with open_source_file(source, "num.txt") as f:
+        for chunk in pd.read_csv(f, sep='\t', chunksize=CSV_CHUNK_SIZE, dtype={'adsh': str, 'tag': str, 'version': str, 'coreg': str, 'footnote': str, 'uom': str, 'ddate': str},
+                                 encoding='utf-8', on_bad_lines='warn', low_memory=False):
+            chunk = chunk.join(sub_keys, on='adsh')
+            chunk['ddate'] = yyyymmdd_dates(chunk['ddate']); bad_dates += int(chunk['ddate'].isna().sum())
+            chunk['qtrs'] = pd.to_numeric(chunk['qtrs'], errors='coerce').astype('Int64')
+            chunk['value'] = pd.to_numeric(chunk['value'], errors='coerce')
+            num_tables.append(to_table(chunk, NUM_SCHEMA))
+    num_table = pa.concat_tables(num_tables).unify_dictionaries() if num_tables else NUM_SCHEMA.empty_table()
+    # Cluster by cik (then adsh) so cik predicates skip row groups; the stable sort keeps num.txt's
+    # row order inside every filing, so per-filing logic (e.g. FCF last-value-wins) sees the same order.
+    sort_keys = pa.table({"cik": num_table["cik"], "adsh": num_table["adsh"].cast(pa.string())}) # (dictionary columns can't be sort keys)
+    num_table = num_table.take(pc.sort_indices(sort_keys, sort_keys=[("cik", "ascending"), ("adsh", "ascending")]))
+
+    metadata = {"quarter": quarter, "source": os.path.abspath(source), "converted_at": time.strftime('%Y-%m-%d %H:%M:%S')}
+    write_table(sub_table, partition_path(root, 'sub', quarter), metadata)
+    write_table(num_table, partition_path(root, 'num', quarter), metadata)
+    result = {'quarter': quarter, 'sub_rows': sub_table.num_rows, 'num_rows': num_table.num_rows, 'bad_dates': bad_dates, 'seconds': time.time() - start}
+    logger.info(f"{quarter}: {result['sub_rows']:,} submissions, {result['num_rows']:,} numeric rows -> {root} in {result['seconds']:.1f}s")
+    return result
+
+# --- Reader API ---
+def build_filter(quarters: Optional[Sequence[str]] = None, ciks: Optional[Sequence[int]] = None,
+                 tags: Optional[Sequence[str]] = None, fy: Optional[Sequence[int]] = None) -> Optional[ds.Expression]:
+    """Dataset filter from the optional predicates (quarter prunes partitions, cik/fy use row-group statistics)."""
+    terms = []
+    if quarters: terms.append(ds.field("quarter").isin(list(quarters)))
+    if ciks: terms.append(ds.field("cik").isin([int(c) for c in ciks]))
+    if tags: terms.append(ds.field("tag").isin(list(tags)))
+    if fy: terms.append(ds.field("fy").isin([int(y) for y in fy]))
+    expression = None
+    for term in terms: expression = term if expression is None else expression & term
+    return expression
+
+def dataset(root: str, table: str) -> ds.Dataset:
+    return ds.dataset(os.path.join(root, table), format="parquet", partitioning=ds.partitioning(pa.schema([("quarter", pa.string())]), flavor="hive"))
+
+NULLABLE_INTS = {pa.int8(): pd.Int64Dtype(), pa.int16(): pd.Int64Dtype(), pa.int32(): pd.Int64Dtype(), pa.int64(): pd.Int64Dtype()}
+
+def to_frame(table: pa.Table) -> pd.DataFrame:
+    """Arrow -> pandas with datetimes for dates, nullable Int64 for integers and plain (non-categorical)
+    strings, close to what read_csv gives the importers."""
+    df = table.to_pandas(date_as_object=False, types_mapper=NULLABLE_INTS.get)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype): df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+def read_num(root: str, quarters: Optional[Sequence[str]] = None, ciks: Optional[Sequence[int]] = None, tags: Optional[Sequence[str]] = None,
+             fy: Optional[Sequence[int]] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """num rows (with cik, fy and quarter) matching all given predicates, across every converted quarter."""
+    return to_frame(dataset(root, 'num').to_table(columns=columns, filter=build_filter(quarters, ciks, tags, fy)))
+
+def read_sub(root: str, quarters: Optional[Sequence[str]] = None, ciks: Optional[Sequence[int]] = None,
+             fy: Optional[Sequence[int]] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    return to_frame(dataset(root, 'sub').to_table(columns=columns, filter=build_filter(quarters, ciks, None, fy)))
+
+def iter_num_batches(root: str, quarter: str, batch_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """One quarter's num rows as DataFrames of batch_size rows (the importers' chunk loop)."""
+    parquet_file = pq.ParquetFile(partition_path(root, 'num', quarter))
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield to_frame(pa.Table.from_batches([batch]))
+
+def iter_tag_filtered_num_batches(root: str, quarter: str, batch_size: int, tags: Sequence[str], columns: Optional[List[str]] = None,
+                                  dropped_columns: Sequence[str] = ('adsh', 'qtrs', 'uom')) -> Iterator[Tuple[pd.DataFrame, int, pd.DataFrame]]:
+    """iter_num_batches with the tag predicate applied in Arrow, before the pandas conversion: yields (rows whose tag is in
+    tags, rows in the batch, dropped_columns of the other rows -- dictionary columns stay categorical, so they are cheap to count).
+    Batches are still batch_size rows of the file, so chunk numbers (and resume points) don't depend on tags."""
+    value_set = pa.array(sorted(tags), pa.string())
+    parquet_file = pq.ParquetFile(partition_path(root, 'num', quarter))
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        keep = pc.is_in(batch.column('tag'), value_set=value_set)
+        dropped = batch.filter(pc.invert(keep)).select(list(dropped_columns)).to_pandas()
+        yield to_frame(pa.Table.from_batches([batch.filter(keep)])), batch.num_rows, dropped
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Convert SEC FSDS quarters to Parquet and query them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="Convert YYYYqN folders / YYYYqN.zip archives (paths or quoted globs)")
+    convert.add_argument("sources", nargs="+")
+    convert.add_argument("--out", required=True, help="Parquet dataset root")
+    convert.add_argument("--overwrite", action="store_true", help="Re-convert quarters that already exist under --out")
+    query = commands.add_parser("query", help="Filter numeric rows across all converted quarters")
+    query.add_argument("--root", required=True, help="Parquet dataset root")
+    query.add_argument("--quarter", action="append", help="YYYYqN (repeatable)")
+    query.add_argument("--cik", type=int, action="append", help="CIK (repeatable)")
+    query.add_argument("--tag", action="append", help="XBRL tag (repeatable)")
+    query.add_argument("--fy", type=int, action="append", help="Fiscal year from sub.txt (repeatable)")
+    query.add_argument("--csv", help="Write the matching rows to this CSV file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)-8s - %(message)s')
+
+    if args.command == "convert":
+        sources = [path for item in args.sources for path in (sorted(glob.glob(item)) if glob.has_magic(item) else [item])]
+        for source in sources:
+            quarter = quarter_label(source)
+            if not args.overwrite and all(os.path.exists(p) for p in quarter_files(args.out, quarter).values()):
+                logger.info(f"{quarter}: already converted, skipping (use --overwrite)."); continue
+            try: convert_quarter(source, args.out, quarter)
+            except (OSError, zipfile.BadZipFile, pd.errors.ParserError) as e: logger.error(f"{quarter}: conversion failed: {e}")
+    else:
+        start = time.time()
+        rows = read_num(args.root, args.quarter, args.cik, args.tag, args.fy)
+        logger.info(f"{len(rows):,} rows from {rows['quarter'].nunique() if len(rows) else 0} quarter(s) in {time.time() - start:.2f}s")
+        if args.csv: rows.to_csv(args.csv, index=False); logger.info(f"Wrote {args.csv}")
+        else: print(rows.head(20).to_string())
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import requests # Not used in this version but kept from source
 import pandas as pd
+import numpy as np
 import time
 import logging
 import mysql.connector
@@ -9,7 +10,15 @@ import os
 import json # Not used in this version but kept from source
 from decimal import Decimal, InvalidOperation # Use Decimal for precision
 import argparse # Import argparse
+import tempfile # Staging TSV files for LOAD DATA LOCAL INFILE
+import zipfile # Reading sub.txt/num.txt straight from FSDS quarter archives
+import hashlib # Import manifest content hashes
+import queue # Bounded hand-off between the reader thread and the DB writer
+import threading
+from contextlib import nullcontext
 from datetime import datetime, timedelta # Import timedelta
+from itertools import compress
+from sec_tag_map import TAG_MAP, CFO_TAGS, CAPEX_TAGS # Side-effect free, shared with transformSECToPeriods.py
 
 # --- Configuration ---
 SOURCE_API_NAME = "SEC_XBRL_Dataset"
@@ -30,22 +39,46 @@ CHUNK_SIZE = 50000
 INSERT_BATCH_SIZE = 5000
 TARGET_UOM = 'USD'
 MAX_DECIMAL_PLACES = 4
+NUMERIC_COLUMNS = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
+SUBMISSION_COLUMNS = [ "cik", "form", "period", "fy", "fp" ] # Joined onto num.txt rows from sub.txt
+
+# --- Bulk Load Configuration ---
+# 'load-data': write each chunk to a TSV, LOAD DATA LOCAL INFILE it into an unindexed TEMPORARY staging
+# table and merge with one INSERT ... SELECT ... ON DUPLICATE KEY UPDATE. Needs local_infile=ON on the
+# server; if the server refuses it the import falls back to 'executemany' (batched parameterized INSERTs).
+# 'anti-join': for re-imports. Same staging load (rows deduped on the primary key first), then one UPDATE ... JOIN
+# for rows whose values differ and one INSERT ... SELECT ... LEFT JOIN ... IS NULL for new keys; unchanged rows
+# (most of a re-imported quarter) cost no write at all. Reports inserted / changed / unchanged rows.
+LOAD_MODES = ('load-data', 'anti-join', 'executemany')
+STAGED_LOAD_MODES = ('load-data', 'anti-join') # Need LOAD DATA LOCAL INFILE
+DEFAULT_LOAD_MODE = 'load-data'
+STAGING_TABLE = f"{DB_TABLE}_stage"
+KEY_COLUMNS = [ "adsh", "tag", "version", "ddate", "qtrs", "uom" ] # PRIMARY KEY of DB_TABLE (sec_numeric_data.sql)
+UPSERT_COLUMNS = [ "value", "footnote", "cik", "form", "period", "fy", "fp" ] # Updated when an existing key is imported again
+LOAD_DATA_REFUSED_ERRNOS = {1148, 2068, 3948} # Command not allowed / LOCAL rejected by client / local_infile disabled
+
+# --- Pipeline Configuration ---
+# A reader thread parses num.txt and builds insert rows while the main thread writes the previous chunk.
+# At most PIPELINE_QUEUE_SIZE built chunks wait for the writer; when the queue is full the reader blocks (back-pressure).
+PIPELINE_QUEUE_SIZE = 2
+PIPELINE_POLL_SECONDS = 0.5 # How often a blocked reader re-checks whether the writer has stopped
+
+# --- Import Manifest Configuration ---
+MANIFEST_TABLE = "sec_import_manifest" # One row per quarter: file fingerprints, progress, status (see sec_import_manifest.sql)
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
 
 # --- FCF Calculation Configuration ---
-CFO_TAGS: Set[str] = {
-    'NetCashProvidedByUsedInOperatingActivities',
-    'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations',
-}
-CAPEX_TAGS: Set[str] = {
-    'PaymentsToAcquirePropertyPlantAndEquipment',
-    'PurchaseOfPropertyPlantAndEquipment',
-    'PaymentsToAcquireProductiveAssets',
-}
-FCF_CALCULATION_METHOD = lambda cfo, capex: cfo + capex # Assumes CapEx is negative
+FCF_CALCULATION_METHOD = lambda cfo, capex: cfo + capex # Assumes CapEx is negative; inputs: sec_tag_map.CFO_TAGS / CAPEX_TAGS
+
+# --- Tag Profile Configuration ---
+# Which num.txt tags are imported: 'all', 'mapped' (sec_tag_map.TAG_MAP + the FCF input tags)
+# or 'file' (one tag per line in --tag-file, '#' starts a comment). Other tags are dropped right after each chunk is read.
+TAG_PROFILES = ('all', 'mapped', 'file')
+DEFAULT_TAG_PROFILE = 'all'
 
 # --- Function to Setup Logging ---
-def setup_logging(log_file_name):
-    """Configures logging with the specified file name."""
+def setup_logging(log_file_name, console: bool = True):
+    """Configures logging with the specified file name (console=False: file only, for pooled quarter runs)."""
     # Close existing handlers if reconfiguring
     for handler in logging.root.handlers[:]:
         logging.root.removeHandler(handler)
@@ -56,7 +89,7 @@ def setup_logging(log_file_name):
         format='%(asctime)s - %(levelname)-8s - %(name)s - %(message)s',
         handlers=[
             logging.FileHandler(log_file_name, mode='a'), # Use the provided name
-            logging.StreamHandler()
+            *([logging.StreamHandler()] if console else [])
         ]
     )
     # Optionally quiet noisy libraries
@@ -66,11 +99,11 @@ def setup_logging(log_file_name):
 logger = logging.getLogger(__name__)
 
 # --- Database Connection ---
-def create_db_connection() -> Optional[mysql.connector.MySQLConnection]:
-    """Creates and returns a database connection."""
+def create_db_connection(allow_local_infile: bool = False) -> Optional[mysql.connector.MySQLConnection]:
+    """Creates and returns a database connection (allow_local_infile is needed for LOAD DATA LOCAL INFILE)."""
     connection = None; logger.debug(f"Attempting DB connection...")
     try:
-        connection = mysql.connector.connect(host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, connection_timeout=10)
+        connection = mysql.connector.connect(host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD, connection_timeout=10, allow_local_infile=allow_local_infile)
         if connection.is_connected(): logger.info("MariaDB connection successful")
         else: logger.error("MariaDB connection failed."); connection = None
     except Error as e: logger.error(f"Error connecting to MariaDB: {e}")
@@ -95,86 +128,160 @@ def format_date(date_val: Any) -> Optional[str]:
     return None
 
 # --- Data Loading and Processing ---
-def load_submissions(filepath: str) -> Optional[pd.DataFrame]:
-    """Loads the sub.txt file into a pandas DataFrame."""
-    logger.info(f"Loading submission data from: {filepath}")
-    if not os.path.exists(filepath): logger.critical(f"Submission file not found: {filepath}"); return None
+def open_archive_member(archive_path: str, member_name: str):
+    """Opens sub.txt/num.txt inside an FSDS quarter zip as a binary stream (no extraction to disk).
+    The member stays readable after the ZipFile itself is closed; close the returned handle when done."""
+    with zipfile.ZipFile(archive_path) as archive:
+        member = next((name for name in archive.namelist() if os.path.basename(name) == member_name), None)
+        if member is None: raise FileNotFoundError(f"{member_name} not found in archive {archive_path}")
+        return archive.open(member)
+
+def load_submissions(filepath: Any) -> Optional[pd.DataFrame]:
+    """Loads the sub.txt file (a path or an open archive member) into a pandas DataFrame."""
+    logger.info(f"Loading submission data from: {getattr(filepath, 'name', filepath)}")
+    if isinstance(filepath, str) and not os.path.exists(filepath): logger.critical(f"Submission file not found: {filepath}"); return None
     try:
         sub_df = pd.read_csv(filepath, sep='\t', dtype={'cik': 'Int64', 'fy': 'Int64', 'adsh': str, 'form': str, 'fp': str}, parse_dates=['period', 'filed'], encoding='utf-8', low_memory=False)
-        logger.info(f"Loaded {len(sub_df)} total submissions.")
-        sub_df = sub_df[['adsh', 'cik', 'name', 'form', 'period', 'fy', 'fp']].copy()
-        sub_df.dropna(subset=['cik'], inplace=True)
-        sub_df['cik'] = sub_df['cik'].astype(int)
-        logger.info(f"Keeping {len(sub_df)} submissions with valid CIKs (importing ALL form types).")
-        return sub_df
+        return prepare_submissions(sub_df)
     except Exception as e: logger.critical(f"Error loading submission file {filepath}: {e}", exc_info=True); return None
 
-def process_numeric_chunk(chunk_df: pd.DataFrame, sub_map: Dict[str, Dict], connection) -> Tuple[int, int]:
-    """Processes a chunk of num.txt, calculates FCF, and inserts into DB."""
+def prepare_submissions(sub_df: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the sub.txt columns the import needs and drops filings without a CIK."""
+    logger.info(f"Loaded {len(sub_df)} total submissions.")
+    sub_df = sub_df[['adsh', 'cik', 'name', 'form', 'period', 'fy', 'fp']].copy()
+    sub_df.dropna(subset=['cik'], inplace=True)
+    sub_df['cik'] = sub_df['cik'].astype(int)
+    sub_df['fy'] = sub_df['fy'].astype('Int64')
+    logger.info(f"Keeping {len(sub_df)} submissions with valid CIKs (importing ALL form types).")
+    return sub_df
+
+def read_num_chunks(num_source: Any, chunksize: int):
+    """num.txt (path or open handle) as a read_csv chunk iterator."""
+    return pd.read_csv(
+        num_source, sep='\t', chunksize=chunksize,
+        dtype={'adsh': str, 'tag': str, 'version': str, 'coreg': str, 'footnote':str, 'uom':str},
+        parse_dates=['ddate'], encoding='utf-8', on_bad_lines='warn', low_memory=False)
+
+def build_submission_frame(sub_df: pd.DataFrame) -> pd.DataFrame:
+    """Indexes submissions by adsh with the columns joined onto num.txt rows (period pre-formatted)."""
+    sub_frame = sub_df.set_index('adsh')[SUBMISSION_COLUMNS].copy()
+    sub_frame['period'] = [format_date(p) for p in sub_frame['period'].tolist()]
+    return sub_frame
+
+def column_values(series: Optional[pd.Series], length: int) -> list:
+    """A column as a Python list with NaN/NA mapped to None (all None if the column is missing)."""
+    if series is None: return [None] * length
+    return series.astype(object).where(series.notna(), None).tolist()
+
+def format_date_column(dates: pd.Series) -> List[Optional[str]]:
+    """format_date over a whole column; parsed datetimes are formatted in one numpy call."""
+    if pd.api.types.is_datetime64_dtype(dates.dtype):
+        text = np.datetime_as_string(dates.to_numpy(dtype='datetime64[D]'), unit='D').tolist()
+        return [None if d == 'NaT' else d for d in text]
+    return [format_date(d) for d in dates.tolist()]
+
+def quantized_value_column(values: pd.Series) -> Tuple[list, List[bool]]:
+    """parse_decimal over a whole value column. Returns (values, keep).
+    Floats whose repr already has at most MAX_DECIMAL_PLACES decimals are passed through as-is
+    (quantizing them is a no-op and the DB stores the same DECIMAL), integers likewise; only the
+    remaining rows go through parse_decimal. keep is False where parse_decimal gives None."""
+    out = values.tolist()
+    if values.dtype.kind == 'f':
+        v = values.to_numpy(dtype='float64')
+        scale = 10.0 ** MAX_DECIMAL_PLACES
+        with np.errstate(invalid='ignore', over='ignore'):
+            magnitude = np.abs(v)
+            # 1e11 keeps two 4-place decimals more than two ulps apart, so the rounded value is the repr
+            exact = ((magnitude < 2.0 ** 53) & (v == np.trunc(v))) | ((magnitude < 1e11) & (np.round(v * scale) / scale == v))
+        slow_rows = np.flatnonzero(~exact).tolist()
+    elif values.dtype.kind in 'iu': slow_rows = []
+    else: slow_rows = range(len(out))
+    keep = [True] * len(out)
+    for i in slow_rows:
+        d = parse_decimal(out[i])
+        if d is None: keep[i] = False; out[i] = None
+        else: out[i] = None if d.is_nan() else d
+    return out, keep
+
+def relevant_rows_mask(chunk_df: pd.DataFrame, sub_frame: pd.DataFrame) -> pd.Series:
+    """num.txt rows build_numeric_rows keeps: known filing, qtrs 0/1/4, TARGET_UOM."""
+    return chunk_df['adsh'].isin(sub_frame.index) & chunk_df['qtrs'].isin([0, 1, 4]) & (chunk_df['uom'] == TARGET_UOM)
+
+def build_numeric_rows(chunk_df: pd.DataFrame, sub_frame: pd.DataFrame, fcf: Optional['FcfAccumulator'] = None) -> List[tuple]:
+    """Filters a chunk of num.txt and joins submission info; its CFO/CapEx facts go to fcf.
+    Column-wise: the chunk is joined to sub_frame on adsh, dates and values are converted as whole
+    columns and the tuples are zipped in one pass. Returns row tuples in NUMERIC_COLUMNS order."""
     logger = logging.getLogger(__name__)
     logger.debug(f"Processing chunk of {len(chunk_df)} numeric rows...")
-    insert_count = 0; error_count = 0; rows_to_insert = []
 
-    relevant_chunk = chunk_df[chunk_df['adsh'].isin(sub_map.keys())].copy()
-    relevant_chunk = relevant_chunk[
-        (relevant_chunk['qtrs'].isin([0, 1, 4])) &
-        (relevant_chunk['uom'] == TARGET_UOM)
-    ].copy()
+    relevant_chunk = chunk_df[relevant_rows_mask(chunk_df, sub_frame)].join(sub_frame, on='adsh')
     logger.debug(f"Chunk filtered to {len(relevant_chunk)} relevant rows.")
-    if relevant_chunk.empty: return 0, 0
-
-    fcf_candidates = {}
-    annual_rows = relevant_chunk[relevant_chunk['qtrs'] == 4]
-    for row in annual_rows.itertuples(index=False):
-        adsh = row.adsh; tag = row.tag; ddate_str = format_date(row.ddate)
-        if not ddate_str: continue
-        try:
-            year = int(ddate_str[:4]); val = parse_decimal(row.value);
-            if val is None: continue
-            key = (adsh, year)
-            if tag in CFO_TAGS: fcf_candidates.setdefault(key, {})['cfo'] = val
-            elif tag in CAPEX_TAGS: fcf_candidates.setdefault(key, {})['capex'] = val
-        except Exception as e: logger.warning(f"Error processing row during FCF collect: {row}. Error: {e}"); continue
-
-    for row in relevant_chunk.itertuples(index=False):
-        adsh = row.adsh; sub_info = sub_map.get(adsh);
-        if not sub_info: continue
-        ddate_str = format_date(row.ddate);
-        if not ddate_str: continue
-        try:
-            value = parse_decimal(row.value);
-            if value is None: continue
-            row_data = { "adsh": adsh, "tag": row.tag, "version": row.version, "ddate": ddate_str, "qtrs": row.qtrs, "uom": row.uom, "value": value, "coreg": getattr(row, 'coreg', None), "footnote": getattr(row, 'footnote', None), "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
-            cols_order = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-            row_tuple = tuple(row_data.get(col) if not pd.isna(row_data.get(col)) else None for col in cols_order)
-            rows_to_insert.append(row_tuple)
-        except Exception as e: logger.warning(f"Error preparing row for insert: {row}. Error: {e}"); continue
-
-    fcf_rows_to_insert = []
-    for (adsh, year), values in fcf_candidates.items():
-        if 'cfo' in values and 'capex' in values:
-            try:
-                fcf_value = FCF_CALCULATION_METHOD(values['cfo'], values['capex'])
-                fcf_value_sql = fcf_value.quantize(Decimal('1e-' + str(MAX_DECIMAL_PLACES)))
-                logger.info(f"[{adsh}-{year}] Calculated FCF: {values['cfo']} + {values['capex']} = {fcf_value_sql}")
-                sub_info = sub_map.get(adsh);
-                if sub_info:
-                    accurate_ddate = f"{year}-12-31"
-                    fcf_row_data = { "adsh": adsh, "tag": "CalculatedFreeCashFlow", "version": "custom/internal", "ddate": accurate_ddate, "qtrs": 4, "uom": TARGET_UOM, "value": fcf_value_sql, "coreg": None, "footnote": "Calculated as CFO + CapEx", "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
-                    cols_order = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-                    fcf_tuple = tuple(fcf_row_data.get(col) if not pd.isna(fcf_row_data.get(col)) else None for col in cols_order)
-                    fcf_rows_to_insert.append(fcf_tuple)
-            except Exception as e: logger.error(f"Error calculating/preparing FCF for {adsh}-{year}: {e}")
-
-    all_rows_to_insert = rows_to_insert + fcf_rows_to_insert
-    if not all_rows_to_insert: logger.debug("No rows to insert."); return 0, 0
+    if relevant_chunk.empty: return []
+
+    ddates = format_date_column(relevant_chunk['ddate'])
+    value_column, keep = quantized_value_column(relevant_chunk['value'])
+    columns = {"ddate": ddates, "value": value_column}
+    for col in NUMERIC_COLUMNS:
+        if col not in columns: columns[col] = column_values(relevant_chunk.get(col), len(relevant_chunk))
+    keep = [k and d is not None for k, d in zip(keep, ddates)]
+    rows_to_insert = list(compress(zip(*(columns[col] for col in NUMERIC_COLUMNS)), keep))
+
+    if fcf is not None: fcf.add(relevant_chunk)
+    return rows_to_insert
+
+class FcfAccumulator:
+    """Annual CFO/CapEx facts of a whole num.txt, kept as typed arrays (filing position in sub_frame,
+    year, CFO/CapEx flag) plus the value as a parse_decimal Decimal, so facts from different chunks pair up
+    and CFO + CapEx is exact at any magnitude (candidates are a tiny share of num.txt).
+    rows() derives all CalculatedFreeCashFlow rows in one vectorized step once the file is read;
+    as before, the last fact per (filing, year) and kind wins and the FCF ddate is Dec 31 of that year."""
+    def __init__(self, sub_frame: pd.DataFrame):
+        self.sub_frame = sub_frame
+        self.parts: List[Tuple[np.ndarray, ...]] = []
 
+    def add(self, relevant_chunk: pd.DataFrame) -> None:
+        """Collects the candidates of a chunk already filtered by relevant_rows_mask."""
+        candidates = relevant_chunk[(relevant_chunk['qtrs'] == 4) & relevant_chunk['tag'].isin(CFO_TAGS | CAPEX_TAGS)]
+        values = np.array([parse_decimal(v) for v in candidates['value'].tolist()], dtype=object)
+        years = np.array([int(d[:4]) if d else -1 for d in format_date_column(candidates['ddate'])], dtype=np.int16)
+        keep = np.array([v is not None and v.is_finite() for v in values], dtype=bool) & (years > 0)
+        if not keep.any(): return
+        self.parts.append((self.sub_frame.index.get_indexer(candidates['adsh'].to_numpy()[keep]).astype(np.int32), years[keep],
+                           candidates['tag'].isin(CAPEX_TAGS).to_numpy()[keep].astype(np.int8),
+                           values[keep]))
+
+    def rows(self) -> List[tuple]:
+        """CalculatedFreeCashFlow row tuples (NUMERIC_COLUMNS order) for every filing/year with both CFO and CapEx."""
+        logger = logging.getLogger(__name__)
+        if not self.parts: return []
+        facts = pd.DataFrame(dict(zip(('filing', 'year', 'capex', 'value'), map(np.concatenate, zip(*self.parts)))))
+        latest = facts.drop_duplicates(['filing', 'year', 'capex'], keep='last')
+        pairs = latest[latest['capex'] == 0].merge(latest[latest['capex'] == 1], on=['filing', 'year'], suffixes=('_cfo', '_capex'))
+        logger.info(f"Calculated FCF for {len(pairs)} filing/year pairs from {len(facts)} annual CFO/CapEx facts.")
+        if pairs.empty: return []
+        fcf_values = FCF_CALCULATION_METHOD(pairs['value_cfo'].to_numpy(), pairs['value_capex'].to_numpy())
+        years = pairs['year'].to_numpy()
+        subs = self.sub_frame.iloc[pairs['filing'].to_numpy()]
+        columns = {
+            "adsh": subs.index.tolist(), "tag": "CalculatedFreeCashFlow", "version": "custom/internal",
+            "ddate": [f"{year}-12-31" for year in years.tolist()], "qtrs": 4, "uom": TARGET_UOM,
+            "value": fcf_values.tolist(), "coreg": None, "footnote": "Calculated as CFO + CapEx",
+            **{col: column_values(subs[col], len(subs)) for col in SUBMISSION_COLUMNS},
+        }
+        return list(zip(*(columns[col] if isinstance(columns[col], list) else [columns[col]] * len(subs) for col in NUMERIC_COLUMNS)))
+
+UPSERT_UPDATE_CLAUSE = f"ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in UPSERT_COLUMNS)}, updated_at = NOW()"
+
+def insert_rows_executemany(all_rows_to_insert: List[tuple], connection) -> Tuple[int, int]:
+    """Inserts rows with batched executemany upserts, committing every INSERT_BATCH_SIZE rows."""
+    logger = logging.getLogger(__name__)
+    insert_count = 0; error_count = 0
     cursor = None; i = 0; batch_for_insert = []
     processed_rows_count = 0 # Track rows successfully submitted in batches
     try:
         cursor = connection.cursor()
-        cols = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-        sql = f"INSERT INTO {DB_TABLE} (`{'`, `'.join(cols)}`, `imported_at`) VALUES ({', '.join(['%s'] * len(cols))}, NOW()) ON DUPLICATE KEY UPDATE value = VALUES(value), footnote = VALUES(footnote), cik = VALUES(cik), form = VALUES(form), period = VALUES(period), fy = VALUES(fy), fp = VALUES(fp), updated_at = NOW();"
+        cols = NUMERIC_COLUMNS
+        sql = f"INSERT INTO {DB_TABLE} (`{'`, `'.join(cols)}`, `imported_at`) VALUES ({', '.join(['%s'] * len(cols))}, NOW()) {UPSERT_UPDATE_CLAUSE};"
 
         for i in range(0, len(all_rows_to_insert), INSERT_BATCH_SIZE):
             batch_for_insert = all_rows_to_insert[i : i + INSERT_BATCH_SIZE]
@@ -201,15 +308,293 @@ def process_numeric_chunk(chunk_df: pd.DataFrame, sub_map: Dict[str, Dict], conn
     # Return count of rows successfully processed in batches, and estimate of errors
     return insert_count, error_count
 
+def tsv_field(value: Any) -> str:
+    """Formats one value for LOAD DATA's default escaping (ESCAPED BY '\\', NULL as \\N)."""
+    if value is None: return '\\N'
+    text = str(value)
+    if '\\' in text or '\t' in text or '\n' in text or '\r' in text:
+        text = text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return text
+
+def load_staging_table(cursor, all_rows_to_insert: List[tuple]) -> int:
+    """Writes rows to a TSV and LOAD DATA LOCAL INFILEs it into the emptied TEMPORARY staging table.
+    Returns the number of rows staged."""
+    logger = logging.getLogger(__name__)
+    cols_sql = f"`{'`, `'.join(NUMERIC_COLUMNS)}`"
+    tsv_file = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='\n', prefix='sec_num_', suffix='.tsv', delete=False)
+    try:
+        with tsv_file:
+            tsv_file.writelines('\t'.join(map(tsv_field, row)) + '\n' for row in all_rows_to_insert)
+        # Session-private, no indexes: loading it costs no index maintenance and no lock on DB_TABLE
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} AS SELECT {cols_sql} FROM {DB_TABLE} LIMIT 0")
+        cursor.execute(f"TRUNCATE TABLE {STAGING_TABLE}")
+        cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {STAGING_TABLE} CHARACTER SET utf8mb4 "
+                       f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols_sql})", (tsv_file.name,))
+        staged_rows = cursor.rowcount
+        if staged_rows != len(all_rows_to_insert): logger.warning(f"Staged {staged_rows} of {len(all_rows_to_insert)} rows (check SHOW WARNINGS).")
+        return staged_rows
+    finally:
+        try: os.remove(tsv_file.name)
+        except OSError: pass
+
+def insert_rows_load_data(all_rows_to_insert: List[tuple], connection) -> Tuple[int, int]:
+    """Bulk-loads rows: TSV -> LOAD DATA LOCAL INFILE into the TEMPORARY staging table -> one
+    INSERT ... SELECT ... ON DUPLICATE KEY UPDATE into DB_TABLE, committed once per chunk.
+    Raises mysql.connector.Error so the caller can fall back to executemany."""
+    logger = logging.getLogger(__name__)
+    cols_sql = f"`{'`, `'.join(NUMERIC_COLUMNS)}`"
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        staged_rows = load_staging_table(cursor, all_rows_to_insert)
+        cursor.execute(f"INSERT INTO {DB_TABLE} ({cols_sql}, `imported_at`) SELECT {cols_sql}, NOW() FROM {STAGING_TABLE} {UPSERT_UPDATE_CLAUSE}")
+        connection.commit()
+        logger.debug(f"Bulk-loaded {staged_rows} rows via {STAGING_TABLE} (DB reported {cursor.rowcount} affected).")
+        return staged_rows, len(all_rows_to_insert) - staged_rows
+    except Error:
+        if connection: connection.rollback()
+        raise
+    finally:
+        if cursor: cursor.close()
+
+def dedupe_on_key(all_rows_to_insert: List[tuple]) -> List[tuple]:
+    """One row per primary key, the last one (what consecutive upserts would leave), in first-seen order.
+    Text key parts are compared case-insensitively, like the table's default collation."""
+    key_positions = [NUMERIC_COLUMNS.index(col) for col in KEY_COLUMNS]
+    unique_rows = {}
+    for row in all_rows_to_insert:
+        unique_rows[tuple(row[i].lower() if isinstance(row[i], str) else row[i] for i in key_positions)] = row
+    return list(unique_rows.values())
+
+def insert_rows_antijoin(all_rows_to_insert: List[tuple], connection, write_counts: Dict[str, int]) -> Tuple[int, int]:
+    """Stages the chunk's deduped rows, updates only existing rows whose values differ (UPDATE ... JOIN)
+    and inserts only new keys (anti-join), committed once per chunk. Adds the chunk's 'inserted',
+    'changed', 'unchanged' and in-chunk 'duplicates' to write_counts.
+    Raises mysql.connector.Error so the caller can fall back to executemany."""
+    logger = logging.getLogger(__name__)
+    cols_sql = f"`{'`, `'.join(NUMERIC_COLUMNS)}`"
+    key_join = ' AND '.join(f"t.`{col}` = s.`{col}`" for col in KEY_COLUMNS)
+    unique_rows = dedupe_on_key(all_rows_to_insert)
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        staged_rows = load_staging_table(cursor, unique_rows)
+        cursor.execute(f"UPDATE {DB_TABLE} t JOIN {STAGING_TABLE} s ON {key_join} "
+                       f"SET {', '.join(f't.`{col}` = s.`{col}`' for col in UPSERT_COLUMNS)}, t.updated_at = NOW() "
+                       f"WHERE NOT ({' AND '.join(f't.`{col}` <=> s.`{col}`' for col in UPSERT_COLUMNS)})")
+        changed_rows = cursor.rowcount
+        cursor.execute(f"INSERT INTO {DB_TABLE} ({cols_sql}, `imported_at`) SELECT {', '.join(f's.`{col}`' for col in NUMERIC_COLUMNS)}, NOW() "
+                       f"FROM {STAGING_TABLE} s LEFT JOIN {DB_TABLE} t ON {key_join} WHERE t.`adsh` IS NULL")
+        inserted_rows = cursor.rowcount
+        connection.commit()
+        write_counts['inserted'] += inserted_rows; write_counts['changed'] += changed_rows
+        write_counts['unchanged'] += staged_rows - inserted_rows - changed_rows
+        write_counts['duplicates'] += len(all_rows_to_insert) - len(unique_rows)
+        logger.debug(f"Anti-join via {STAGING_TABLE}: {staged_rows} staged, {inserted_rows} inserted, {changed_rows} changed.")
+        return staged_rows, len(unique_rows) - staged_rows
+    except Error:
+        if connection: connection.rollback()
+        raise
+    finally:
+        if cursor: cursor.close()
+
+def write_numeric_rows(all_rows_to_insert: List[tuple], connection, load_mode: str = 'executemany', write_slot: Any = None,
+                       write_counts: Optional[Dict[str, int]] = None) -> Tuple[int, int, str]:
+    """Inserts one chunk's rows (from build_numeric_rows) into the DB.
+    write_slot (e.g. a semaphore shared by parallel quarter imports) is held only around the DB write.
+    write_counts collects the 'anti-join' mode's inserted/changed/unchanged/duplicates counts.
+    Returns (rows inserted, rows failed, load mode to use for the next chunk)."""
+    logger = logging.getLogger(__name__)
+    if not all_rows_to_insert: logger.debug("No rows to insert."); return 0, 0, load_mode
+    with write_slot or nullcontext():
+        if load_mode in STAGED_LOAD_MODES:
+            try:
+                if load_mode == 'anti-join': return (*insert_rows_antijoin(all_rows_to_insert, connection, write_counts), load_mode)
+                return (*insert_rows_load_data(all_rows_to_insert, connection), load_mode)
+            except Error as e:
+                if e.errno in LOAD_DATA_REFUSED_ERRNOS:
+                    logger.warning(f"LOAD DATA LOCAL INFILE not permitted ({e}). Using executemany for the rest of the import.")
+                    load_mode = 'executemany'
+                else: logger.error(f"Bulk load failed ({e}). Retrying this chunk with executemany.")
+        return (*insert_rows_executemany(all_rows_to_insert, connection), load_mode)
+
+# --- Tag Profiles ---
+def load_tag_file(path: str) -> Set[str]:
+    """Tags listed in a text file: one per line (commas/whitespace also separate), '#' starts a comment."""
+    with open(path, encoding='utf-8') as f:
+        return {tag for line in f for tag in line.split('#', 1)[0].replace(',', ' ').split()}
+
+def resolve_tag_allowlist(tag_profile: str, tag_file: Optional[str] = None) -> Optional[frozenset]:
+    """Tags to import for a profile; None means all tags."""
+    if tag_profile == 'all': return None
+    if tag_profile == 'mapped':
+        return frozenset(tag for tags in TAG_MAP.values() for tag in tags) | CFO_TAGS | CAPEX_TAGS
+    if not tag_file: raise ValueError("tag profile 'file' needs a tag file")
+    tags = load_tag_file(tag_file)
+    if not tags: raise ValueError(f"No tags found in {tag_file}")
+    return frozenset(tags)
+
+def tag_profile_label(tag_profile: str, tag_allowlist: Optional[frozenset]) -> str:
+    """Manifest value identifying the tag set: 'all', or the profile plus a short hash of its sorted tags."""
+    if tag_allowlist is None: return 'all'
+    return f"{tag_profile}:{hashlib.sha256(' '.join(sorted(tag_allowlist)).encode()).hexdigest()[:12]}"
+
+def filter_tags(chunk_df: pd.DataFrame, tag_allowlist: Optional[frozenset]) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Splits a chunk into the rows whose tag is in the allowlist and the dropped rest (None if nothing is dropped)."""
+    if tag_allowlist is None: return chunk_df, None
+    keep = chunk_df['tag'].isin(tag_allowlist)
+    if keep.all(): return chunk_df, None
+    return chunk_df[keep], chunk_df[~keep]
+
+def count_tag_drops(dropped: Optional[pd.DataFrame], sub_frame: pd.DataFrame) -> Dict[str, int]:
+    """Rows dropped by the tag filter ('rows') and how many of them would otherwise have been imported
+    ('importable': USD, qtrs 0/1/4, known filing)."""
+    if dropped is None or dropped.empty: return {'rows': 0, 'importable': 0}
+    return {'rows': len(dropped), 'importable': int(relevant_rows_mask(dropped, sub_frame).sum())}
+
+# --- Read/Transform Pipeline ---
+PIPELINE_DONE = object() # End-of-input marker put on the queue by the reader thread
+
+def put_unless_stopped(out_queue: queue.Queue, item: Any, stop_event: threading.Event) -> bool:
+    """Blocks while out_queue is full; gives up (False) once stop_event is set so the reader never outlives the writer."""
+    while not stop_event.is_set():
+        try: out_queue.put(item, timeout=PIPELINE_POLL_SECONDS); return True
+        except queue.Full: continue
+    return False
+
+def read_and_build_chunks(num_chunks, sub_frame: pd.DataFrame, resume_chunks: int, out_queue: queue.Queue,
+                          stop_event: threading.Event, stage_seconds: Dict[str, float],
+                          tag_allowlist: Optional[frozenset] = None) -> None:
+    """Reader thread: parses num.txt chunks, drops tags outside tag_allowlist and builds their insert rows ahead of the writer.
+    Puts (chunk number, num.txt rows read, tag drop counts, rows to insert) per chunk -- rows is None for chunks at or
+    before resume_chunks, whose CFO/CapEx facts are still collected -- then (None, 0, None, calculated FCF rows of the
+    whole file) and PIPELINE_DONE, or the exception that stopped it for the writer to re-raise. Drops travel with their
+    chunk so the writer counts only chunks it commits (the reader runs up to PIPELINE_QUEUE_SIZE chunks ahead).
+    num_chunks yields DataFrames, or (kept rows, rows read, dropped rows) when the tags were already filtered at the source (--parquet)."""
+    chunk_num = 0; fcf = FcfAccumulator(sub_frame)
+    try:
+        chunks = iter(num_chunks)
+        while not stop_event.is_set():
+            t0 = time.perf_counter(); chunk = next(chunks, None); t1 = time.perf_counter()
+            stage_seconds['read'] += t1 - t0
+            if chunk is None: break
+            chunk_num += 1
+            if isinstance(chunk, tuple): chunk, rows_read, dropped = chunk # Filtered in Arrow before the pandas conversion
+            else: rows_read = len(chunk); chunk, dropped = filter_tags(chunk, tag_allowlist) # rows_read is before the filter: num_rows and the drop percentage count every num.txt row
+            drops = count_tag_drops(dropped, sub_frame)
+            if chunk_num > resume_chunks: rows = build_numeric_rows(chunk, sub_frame, fcf)
+            else: rows = None; fcf.add(chunk[relevant_rows_mask(chunk, sub_frame)])
+            t2 = time.perf_counter(); stage_seconds['transform'] += t2 - t1
+            if not put_unless_stopped(out_queue, (chunk_num, rows_read, drops, rows), stop_event): return
+            stage_seconds['reader_blocked'] += time.perf_counter() - t2
+        if stop_event.is_set(): return
+        t0 = time.perf_counter(); fcf_rows = fcf.rows(); stage_seconds['transform'] += time.perf_counter() - t0
+        if fcf_rows and not put_unless_stopped(out_queue, (None, 0, None, fcf_rows), stop_event): return
+        item = PIPELINE_DONE
+    except BaseException as e: item = e
+    put_unless_stopped(out_queue, item, stop_event)
+
+def log_stage_times(stage_seconds: Dict[str, float], wall_seconds: float) -> None:
+    logger = logging.getLogger(__name__)
+    logger.info(f"Stage times: read {stage_seconds['read']:.2f}s, transform {stage_seconds['transform']:.2f}s, write {stage_seconds['write']:.2f}s "
+                f"(pipeline wall time {wall_seconds:.2f}s)")
+    logger.info(f"Reader blocked on a full queue {stage_seconds['reader_blocked']:.2f}s (DB-bound), "
+                f"writer waited for rows {stage_seconds['writer_waiting']:.2f}s (parse-bound)")
+
+# --- Import Manifest ---
+MANIFEST_DDL = f"""CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+    quarter VARCHAR(16) NOT NULL PRIMARY KEY,
+    source VARCHAR(512) NULL,
+    sub_size BIGINT NULL, sub_mtime DOUBLE NULL, sub_hash VARCHAR(80) NULL,
+    num_size BIGINT NULL, num_mtime DOUBLE NULL, num_hash VARCHAR(80) NULL,
+    sub_rows INT NULL, num_rows BIGINT NULL, rows_submitted BIGINT NULL, rows_failed BIGINT NULL,
+    chunk_size INT NULL, last_committed_chunk INT NOT NULL DEFAULT 0,
+    tag_profile VARCHAR(64) NULL, rows_dropped_by_tag BIGINT NULL,
+    status VARCHAR(16) NOT NULL,
+    started_at TIMESTAMP NULL, finished_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+)""" # Same definition as sec_import_manifest.sql
+MANIFEST_MIGRATIONS = [ # Columns added after the table was first created (MariaDB ADD COLUMN IF NOT EXISTS)
+    f"ALTER TABLE {MANIFEST_TABLE} ADD COLUMN IF NOT EXISTS tag_profile VARCHAR(64) NULL AFTER last_committed_chunk",
+    f"ALTER TABLE {MANIFEST_TABLE} ADD COLUMN IF NOT EXISTS rows_dropped_by_tag BIGINT NULL AFTER tag_profile",
+]
+
+def quarter_label(path: str) -> str:
+    """YYYYqN label of a quarter folder or archive (the basename without .zip); the manifest key."""
+    name = os.path.basename(os.path.normpath(path))
+    return name[:-len(".zip")] if name.lower().endswith(".zip") else name
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''): digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
+
+def quarter_fingerprint(archive: Optional[str], plain_files: Dict[str, str], manifest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Size/mtime/hash of the quarter's sub and num files. Archives use the CRC-32 from the zip directory
+    (no read); plain files ({'sub': path, 'num': path}: sub.txt/num.txt or the Parquet partitions) are
+    SHA-256 hashed, unless size and mtime match the manifest (then its hash is reused)."""
+    fingerprint = {}
+    if archive:
+        with zipfile.ZipFile(archive) as zip_file:
+            members = {os.path.basename(info.filename): info for info in zip_file.infolist()}
+            for prefix in ('sub', 'num'):
+                info = members[f"{prefix}.txt"]
+                fingerprint.update({f"{prefix}_size": info.file_size, f"{prefix}_mtime": None, f"{prefix}_hash": f"crc32:{info.CRC:08x}"})
+        return fingerprint
+    for prefix in ('sub', 'num'):
+        path = plain_files[prefix]; stat = os.stat(path)
+        known = manifest and manifest.get(f"{prefix}_size") == stat.st_size and manifest.get(f"{prefix}_mtime") == stat.st_mtime
+        fingerprint.update({f"{prefix}_size": stat.st_size, f"{prefix}_mtime": stat.st_mtime,
+                            f"{prefix}_hash": manifest[f"{prefix}_hash"] if known else file_sha256(path)})
+    return fingerprint
+
+def same_content(manifest: Optional[Dict[str, Any]], fingerprint: Dict[str, Any]) -> bool:
+    return bool(manifest) and all(manifest.get(k) == fingerprint[k] for k in ('sub_size', 'sub_hash', 'num_size', 'num_hash'))
+
+def manifest_tag_profile(manifest: Optional[Dict[str, Any]]) -> str:
+    return (manifest or {}).get('tag_profile') or 'all' # Imports from before tag profiles took every tag
+
+def read_manifest(connection, quarter: str) -> Optional[Dict[str, Any]]:
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(MANIFEST_DDL)
+        for migration in MANIFEST_MIGRATIONS: cursor.execute(migration)
+        cursor.execute(f"SELECT * FROM {MANIFEST_TABLE} WHERE quarter = %s", (quarter,))
+        return cursor.fetchone()
+    finally: cursor.close()
+
+def write_manifest(connection, quarter: str, **fields: Any) -> None:
+    """Upserts the given manifest columns for a quarter. A failed manifest write is logged, never fatal."""
+    logger = logging.getLogger(__name__)
+    sql = (f"INSERT INTO {MANIFEST_TABLE} (quarter, {', '.join(fields)}) VALUES ({', '.join(['%s'] * (len(fields) + 1))}) "
+           f"ON DUPLICATE KEY UPDATE {', '.join(f'{k} = VALUES({k})' for k in fields)}")
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql, (quarter, *fields.values()))
+        connection.commit()
+    except Error as e: logger.warning(f"Could not update {MANIFEST_TABLE} for {quarter}: {e}")
+    finally:
+        if cursor: cursor.close()
+
 # --- Main Execution ---
 def main():
     # 1. Setup Argument Parser
     parser = argparse.ArgumentParser(description="Import SEC Financial Statement Data from local files into MariaDB.")
-    parser.add_argument(
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument(
         "-d", "--data-dir",
-        required=True,
         help="Path to the directory containing sub.txt and num.txt"
         )
+    source_group.add_argument(
+        "--archive",
+        help="Path to an FSDS quarter zip (e.g. 2024q2.zip); sub.txt/num.txt are streamed from it without unzipping"
+        )
+    source_group.add_argument(
+        "--parquet",
+        help="Root of a Parquet dataset written by fsds_parquet.py convert; needs --quarter (requires pyarrow)"
+        )
     # *** ADDED LOG FILE ARGUMENT ***
     parser.add_argument(
         "--log-file",
@@ -218,74 +603,191 @@ def main():
         help=f"Specify the path for the output log file. Default: {DEFAULT_LOG_FILENAME}"
     )
     # *** END OF ADDITION ***
+    parser.add_argument(
+        "--load-mode",
+        choices=LOAD_MODES,
+        default=DEFAULT_LOAD_MODE,
+        help=f"'load-data' = LOAD DATA LOCAL INFILE via a staging table (needs local_infile=ON), 'anti-join' = same staging, but only new or changed rows are written (re-imports), 'executemany' = batched INSERTs. Default: {DEFAULT_LOAD_MODE}"
+    )
+    parser.add_argument(
+        "--tag-profile",
+        choices=TAG_PROFILES,
+        default=DEFAULT_TAG_PROFILE,
+        help=f"Tags to import: 'all', 'mapped' (sec_tag_map.TAG_MAP + CFO/CapEx tags) or 'file' (--tag-file). Default: {DEFAULT_TAG_PROFILE}"
+    )
+    parser.add_argument(
+        "--tag-file",
+        help="Tag list for --tag-profile file: one tag per line, '#' comments"
+    )
+    parser.add_argument(
+        "--quarter",
+        help="YYYYqN to import from the --parquet dataset (see fsds_parquet.py)"
+        )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help=f"Re-import even if {MANIFEST_TABLE} says this quarter was already imported from identical files (also ignores a partial run's resume point)"
+    )
     args = parser.parse_args()
+    if bool(args.parquet) != bool(args.quarter): parser.error("--parquet and --quarter go together")
+    if (args.tag_profile == 'file') != bool(args.tag_file): parser.error("--tag-file goes with --tag-profile file")
+    summary = run_import(args.data_dir, args.archive, args.log_file, args.load_mode, force=args.force, parquet_root=args.parquet, quarter=args.quarter,
+                         tag_profile=args.tag_profile, tag_file=args.tag_file)
+    raise SystemExit(0 if summary['ok'] else 1)
 
-    # 2. Setup Logging using the argument
-    setup_logging(args.log_file)
+def run_import(data_directory: Optional[str], archive: Optional[str], log_file: str, load_mode: str = DEFAULT_LOAD_MODE,
+               write_slot: Any = None, console: bool = True, force: bool = False,
+               parquet_root: Optional[str] = None, quarter: Optional[str] = None,
+               tag_profile: str = DEFAULT_TAG_PROFILE, tag_file: Optional[str] = None) -> Dict[str, Any]:
+    """Imports one quarter (a sub.txt/num.txt directory, an FSDS zip, or quarter `quarter` of an
+    fsds_parquet dataset at parquet_root) and returns its summary:
+    {'source', 'ok', 'skipped', 'rows', 'errors', 'dropped', 'write_counts', 'chunks', 'seconds', 'stage_seconds'}. Also used by importSECQuarters.py.
+    Only tags of tag_profile are imported ('dropped' counts the other num.txt rows).
+    Progress is kept in MANIFEST_TABLE: a quarter whose files are unchanged since a complete import is
+    skipped, and an interrupted import resumes after its last committed num.txt chunk."""
+    # 2. Setup Logging
+    setup_logging(log_file, console=console)
     logger = logging.getLogger(__name__) # Re-get logger after setup
 
     # 3. Log startup info
-    data_directory = args.data_dir
-    sub_file = os.path.join(data_directory, "sub.txt")
-    num_file = os.path.join(data_directory, "num.txt")
+    source_label = archive or data_directory or f"{parquet_root} (quarter={quarter})"
+    quarter = quarter or quarter_label(source_label)
+    if parquet_root:
+        import fsds_parquet # Optional dependency (pyarrow); only needed for --parquet
+        parquet_files = fsds_parquet.quarter_files(parquet_root, quarter)
+        sub_file, num_file = parquet_files['sub'], parquet_files['num']
+    else:
+        sub_file = os.path.join(data_directory, "sub.txt") if data_directory else "sub.txt"
+        num_file = os.path.join(data_directory, "num.txt") if data_directory else "num.txt"
 
     start_time = time.time()
+    summary = {'source': source_label, 'ok': False, 'skipped': False, 'rows': 0, 'errors': 0, 'dropped': 0, 'chunks': 0, 'seconds': 0.0}
     logger.info("==================================================")
     logger.info(f"=== Starting SEC Data Import (ALL FORM TYPES) ===")
-    logger.info(f"Source Directory: {data_directory}")
+    logger.info(f"Source: {source_label}")
     logger.info(f"Target Table: {DB_TABLE}")
-    logger.info(f"Log File: {args.log_file}") # Log the actual log file
-    logger.info(f"Chunk Size: {CHUNK_SIZE}, Insert Batch Size: {INSERT_BATCH_SIZE}")
+    logger.info(f"Log File: {log_file}") # Log the actual log file
+    logger.info(f"Chunk Size: {CHUNK_SIZE}, Insert Batch Size: {INSERT_BATCH_SIZE}, Load Mode: {load_mode}")
+    try: tag_allowlist = resolve_tag_allowlist(tag_profile, tag_file)
+    except (OSError, ValueError, ImportError) as e: logger.critical(f"Error: Cannot load tag profile '{tag_profile}': {e}"); return summary
+    profile_label = tag_profile_label(tag_profile, tag_allowlist)
+    logger.info(f"Tag Profile: {profile_label}" + (f" ({len(tag_allowlist)} tags{', from ' + tag_file if tag_file else ''})" if tag_allowlist is not None else ""))
     logger.info("==================================================")
 
     # 4. Validate input files
-    if not os.path.isdir(data_directory): logger.critical(f"Error: Data directory not found: {data_directory}"); return
-    if not os.path.isfile(sub_file): logger.critical(f"Error: Submission file not found: {sub_file}"); return
-    if not os.path.isfile(num_file): logger.critical(f"Error: Numeric data file not found: {num_file}"); return
-    logger.info(f"Found required files in {data_directory}")
+    if archive:
+        if not os.path.isfile(archive) or not zipfile.is_zipfile(archive): logger.critical(f"Error: Archive not found or not a zip file: {archive}"); return summary
+        with zipfile.ZipFile(archive) as zip_file: member_names = {os.path.basename(name) for name in zip_file.namelist()}
+        missing = [name for name in (sub_file, num_file) if name not in member_names]
+        if missing: logger.critical(f"Error: {', '.join(missing)} not found in archive {archive}"); return summary
+    elif parquet_root:
+        for path in (sub_file, num_file):
+            if not os.path.isfile(path): logger.critical(f"Error: Parquet partition not found: {path} (run fsds_parquet.py convert first)"); return summary
+    else:
+        if not os.path.isdir(data_directory): logger.critical(f"Error: Data directory not found: {data_directory}"); return summary
+        if not os.path.isfile(sub_file): logger.critical(f"Error: Submission file not found: {sub_file}"); return summary
+        if not os.path.isfile(num_file): logger.critical(f"Error: Numeric data file not found: {num_file}"); return summary
+    logger.info(f"Found required files in {source_label}")
 
     # 5. Connect to DB
-    db_connection = create_db_connection()
-    if not db_connection: logger.critical("Exiting: Database connection failed."); return
+    db_connection = create_db_connection(allow_local_infile=load_mode in STAGED_LOAD_MODES)
+    if not db_connection: logger.critical("Exiting: Database connection failed."); return summary
 
     total_processed_rows = 0
     total_errors = 0 # Track estimated errors based on failed batches
+    num_source = None
+    completed = False
+    chunk_num = 0; num_rows_read = 0; interrupted = False
+    reader = None; stop_reading = threading.Event()
+    stage_seconds = dict.fromkeys(('read', 'transform', 'write', 'reader_blocked', 'writer_waiting'), 0.0)
+    drop_counts = {'rows': 0, 'importable': 0}
+    write_counts = dict.fromkeys(('inserted', 'changed', 'unchanged', 'duplicates'), 0)
 
     try:
+        # 5b. Check the import manifest: skip unchanged quarters, find the resume point of a partial run
+        manifest = read_manifest(db_connection, quarter)
+        fingerprint = quarter_fingerprint(archive, {'sub': sub_file, 'num': num_file}, manifest)
+        unchanged = same_content(manifest, fingerprint)
+        previous_profile = manifest_tag_profile(manifest)
+        if unchanged and manifest['status'] == 'complete' and previous_profile in ('all', profile_label) and not force:
+            logger.info(f"{quarter}: files unchanged since the complete import at {manifest['finished_at']} ({manifest['rows_submitted']} rows, tag profile {previous_profile}). Skipping (use --force to re-import).")
+            summary.update(ok=True, skipped=True, rows=0, seconds=time.time() - start_time)
+            return summary
+        resume_chunks = 0
+        if unchanged and manifest['status'] != 'complete' and manifest['chunk_size'] == CHUNK_SIZE and previous_profile == profile_label and not force:
+            resume_chunks = manifest['last_committed_chunk'] or 0
+            total_processed_rows = manifest['rows_submitted'] or 0; total_errors = manifest['rows_failed'] or 0
+            drop_counts['rows'] = manifest.get('rows_dropped_by_tag') or 0
+        elif manifest and not unchanged: logger.info(f"{quarter}: files changed since the last import; importing again.")
+        elif manifest and previous_profile != profile_label: logger.info(f"{quarter}: last imported with tag profile {previous_profile}; importing again with {profile_label}.")
+        write_manifest(db_connection, quarter, source=os.path.abspath(source_label), **fingerprint, chunk_size=CHUNK_SIZE, tag_profile=profile_label, rows_dropped_by_tag=drop_counts['rows'],
+                       last_committed_chunk=resume_chunks, rows_submitted=total_processed_rows, rows_failed=total_errors, status='running',
+                       **({} if resume_chunks else {'started_at': datetime.now()}), finished_at=None)
+        if resume_chunks: logger.info(f"{quarter}: resuming an interrupted import after chunk {resume_chunks} (chunks 1-{resume_chunks} are parsed but not written).")
+
         # 6. Load Submissions
-        sub_df = load_submissions(sub_file)
-        if sub_df is None: logger.critical("Failed to load submission data. Exiting."); return
-        sub_map = sub_df.set_index('adsh').to_dict('index')
-        logger.info(f"Created submission map for {len(sub_map)} filings.")
+        if archive:
+            with open_archive_member(archive, sub_file) as sub_member: sub_df = load_submissions(sub_member)
+        elif parquet_root: sub_df = prepare_submissions(fsds_parquet.read_sub(parquet_root, quarters=[quarter]))
+        else: sub_df = load_submissions(sub_file)
+        if sub_df is None: logger.critical("Failed to load submission data. Exiting."); return summary
+        write_manifest(db_connection, quarter, sub_rows=len(sub_df))
+        sub_frame = build_submission_frame(sub_df)
+        logger.info(f"Indexed {len(sub_frame)} filings for the num.txt join.")
         del sub_df # Free memory
 
         # 7. Process Numeric Data in Chunks
-        logger.info(f"Processing numeric data from {num_file} in chunks...")
-        chunk_num = 0
-        for chunk in pd.read_csv(
-            num_file, sep='\t', chunksize=CHUNK_SIZE,
-            dtype={'adsh': str, 'tag': str, 'version': str, 'coreg': str, 'footnote':str, 'uom':str},
-            parse_dates=['ddate'], encoding='utf-8', on_bad_lines='warn', low_memory=False):
-            chunk_num += 1
-            logger.info(f"--- Processing Chunk {chunk_num} ---")
-            processed_in_chunk, errors_in_chunk = process_numeric_chunk(chunk, sub_map, db_connection)
+        logger.info(f"Processing numeric data from {num_file} in {source_label} in chunks...")
+        if parquet_root:
+            num_columns = [f.name for f in fsds_parquet.NUM_SCHEMA if f.name not in ('cik', 'fy')]
+            if tag_allowlist is None: num_chunks = fsds_parquet.iter_num_batches(parquet_root, quarter, CHUNK_SIZE, columns=num_columns)
+            else: num_chunks = fsds_parquet.iter_tag_filtered_num_batches(parquet_root, quarter, CHUNK_SIZE, tag_allowlist, columns=num_columns) # Dropped rows are never decoded into pandas
+        else:
+            num_source = open_archive_member(archive, num_file) if archive else num_file
+            num_chunks = read_num_chunks(num_source, CHUNK_SIZE)
+        row_batches = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        reader = threading.Thread(target=read_and_build_chunks, args=(num_chunks, sub_frame, resume_chunks, row_batches, stop_reading, stage_seconds, tag_allowlist),
+                                  name=f"{quarter}-reader", daemon=True)
+        pipeline_start = time.perf_counter(); reader.start()
+        while True:
+            t0 = time.perf_counter(); item = row_batches.get(); t1 = time.perf_counter()
+            stage_seconds['writer_waiting'] += t1 - t0
+            if item is PIPELINE_DONE: completed = True; break
+            if isinstance(item, BaseException): raise item # Reader failed: handled like an error in this thread
+            batch_num, rows_in_chunk, chunk_drops, rows_to_insert = item; num_rows_read += rows_in_chunk
+            if rows_to_insert is None: continue # Already committed by the interrupted run (its drops are in the manifest)
+            if batch_num is None: logger.info(f"--- Writing {len(rows_to_insert)} Calculated FCF Rows ---")
+            else: chunk_num = batch_num; logger.info(f"--- Processing Chunk {chunk_num} ---")
+            processed_in_chunk, errors_in_chunk, load_mode = write_numeric_rows(rows_to_insert, db_connection, load_mode, write_slot, write_counts)
+            stage_seconds['write'] += time.perf_counter() - t1
             total_processed_rows += processed_in_chunk
             total_errors += errors_in_chunk
+            if batch_num is None: continue # FCF rows are re-derived on resume; only num.txt chunks are tracked
+            for key in drop_counts: drop_counts[key] += chunk_drops[key]
+            write_manifest(db_connection, quarter, last_committed_chunk=chunk_num, num_rows=num_rows_read, rows_submitted=total_processed_rows, rows_failed=total_errors, rows_dropped_by_tag=drop_counts['rows'])
             # Check DB connection status periodically
             if chunk_num % 10 == 0: # Check every 10 chunks
                  if not db_connection or not db_connection.is_connected():
                      logger.warning("DB connection lost during chunk processing. Reconnecting...")
-                     db_connection = create_db_connection()
+                     db_connection = create_db_connection(allow_local_infile=load_mode in STAGED_LOAD_MODES)
                      if not db_connection:
                          logger.critical("Reconnection failed. Stopping processing.")
                          break # Stop if cannot reconnect
                  else:
                      logger.debug("DB connection check passed.")
+        log_stage_times(stage_seconds, time.perf_counter() - pipeline_start)
 
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted after chunk {chunk_num}; the next run resumes after the last committed chunk."); interrupted = True; raise
     except FileNotFoundError as fnf_e: logger.critical(f"File not found during processing: {fnf_e}")
     except pd.errors.EmptyDataError as ede: logger.error(f"Empty data error reading file: {ede}")
     except Exception as e: logger.critical(f"An unexpected error occurred during file processing: {e}", exc_info=True)
     finally:
+        if reader is not None: stop_reading.set(); reader.join() # Reader finishes its current chunk, then exits
+        if num_source is not None and not isinstance(num_source, str): num_source.close()
+        if not summary['skipped'] and db_connection and db_connection.is_connected():
+            write_manifest(db_connection, quarter, status='complete' if completed else ('interrupted' if interrupted else 'failed'), num_rows=num_rows_read,
+                           rows_submitted=total_processed_rows, rows_failed=total_errors, rows_dropped_by_tag=drop_counts['rows'], **({'finished_at': datetime.now()} if completed else {}))
         # 8. Close DB Connection
         if db_connection and db_connection.is_connected():
             try: db_connection.close(); logger.info("Database connection closed.")
@@ -298,7 +800,15 @@ def main():
     logger.info(f"Total time taken: {end_time - start_time:.2f} seconds")
     logger.info(f"Total rows submitted in successful batches: {total_processed_rows}")
     logger.info(f"Total rows potentially skipped due to errors: {total_errors}")
+    if any(write_counts.values()):
+        logger.info(f"Anti-join writes: {write_counts['inserted']} inserted, {write_counts['changed']} changed, {write_counts['unchanged']} unchanged "
+                    f"(+{write_counts['duplicates']} duplicate keys within chunks collapsed)")
+    if tag_allowlist is not None:
+        logger.info(f"Rows dropped by tag profile {profile_label}: {drop_counts['rows']} of {num_rows_read} num.txt rows ({drop_counts['rows'] / num_rows_read if num_rows_read else 0:.1%}); "
+                    f"{drop_counts['importable']} of them would otherwise have been imported (USD, qtrs 0/1/4) in this run")
     logger.info("==================================================")
+    summary.update(ok=completed, rows=total_processed_rows, errors=total_errors, dropped=drop_counts['rows'], write_counts=write_counts, chunks=chunk_num, seconds=end_time - start_time, stage_seconds=stage_seconds)
+    return summary
 
 # --- Entry Point ---
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+# <<< importSECQuarters.py >>>
+# Imports many FSDS quarters (YYYYqN folders or YYYYqN.zip archives) with importSECData_AllForms.run_import
+# in a process pool. Every quarter keeps its own log file; at most --max-db-writers quarters write to the
+# database at the same time (the others keep reading/parsing their next chunk), and a combined summary
+# is printed at the end. Replaces the serial loopImportData2.sh.
+#
+#   python3 importSECQuarters.py --base-dir /media/devmon/Kay/us_data 2018q3 2018q2 2017q4
+#   python3 importSECQuarters.py "/media/devmon/Kay/us_data/201[2-8]q?" --workers 6 --max-db-writers 2
+#   python3 importSECQuarters.py "./data/*.zip" --log-dir ./logs
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+import importSECData_AllForms as importer
+from importSECData_AllForms import quarter_label
+
+# --- Configuration ---
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_MAX_DB_WRITERS = 2
+DEFAULT_RUNNER_LOG = "importSECQuarters.log"
+QUARTER_PATTERN = re.compile(r"^\d{4}q[1-4]$")
+
+logger = logging.getLogger("importSECQuarters")
+
+# --- Quarter Discovery ---
+def is_quarter_source(path: str) -> bool:
+    return os.path.isdir(path) or (os.path.isfile(path) and path.lower().endswith(".zip"))
+
+def resolve_quarters(items: List[str], base_dir: str) -> List[str]:
+    """Expands quarter names, paths and glob patterns (relative ones also tried under base_dir) into
+    quarter folders/archives, in the given order. A folder wins over a zip of the same quarter."""
+    resolved: Dict[str, str] = {}
+    for item in items:
+        if glob.has_magic(item):
+            matches = sorted(glob.glob(item)) or sorted(glob.glob(os.path.join(base_dir, item)))
+        else:
+            matches = [next((c for c in (item, os.path.join(base_dir, item), os.path.join(base_dir, f"{item}.zip")) if is_quarter_source(c)), None)]
+        matches = [m for m in matches if m and is_quarter_source(m)]
+        if not matches: logger.warning(f"No quarter folder or archive found for '{item}'."); continue
+        for path in matches:
+            label = quarter_label(path)
+            if not QUARTER_PATTERN.match(label): logger.warning(f"'{path}' does not look like a YYYYqN quarter; importing it anyway.")
+            if label not in resolved or (os.path.isdir(path) and not os.path.isdir(resolved[label])): resolved[label] = path
+    return list(resolved.values())
+
+# --- Worker ---
+_db_write_slots = None # Shared BoundedSemaphore, set in each worker process
+
+def _init_worker(write_slots) -> None:
+    global _db_write_slots
+    _db_write_slots = write_slots
+
+def import_quarter(path: str, log_dir: str, load_mode: str, force: bool = False, tag_profile: str = importer.DEFAULT_TAG_PROFILE, tag_file: str = None) -> Dict[str, Any]:
+    """Runs one quarter in a pool worker; its log goes to <log_dir>/<YYYYqN>.log only."""
+    label = quarter_label(path)
+    log_file = os.path.join(log_dir, f"{label}.log")
+    data_dir, archive = (None, path) if os.path.isfile(path) else (path, None)
+    try: summary = importer.run_import(data_dir, archive, log_file, load_mode, write_slot=_db_write_slots, console=False, force=force, tag_profile=tag_profile, tag_file=tag_file)
+    except Exception as e: summary = {'source': path, 'ok': False, 'skipped': False, 'rows': 0, 'errors': 0, 'dropped': 0, 'chunks': 0, 'seconds': 0.0, 'error': repr(e)}
+    return {**summary, 'quarter': label, 'log_file': log_file}
+
+# --- Summary ---
+def log_combined_summary(results: List[Dict[str, Any]], elapsed: float) -> None:
+    logger.info("==================================================")
+    logger.info(f"{'quarter':<10} {'status':<7} {'rows':>12} {'errors':>9} {'chunks':>7} {'seconds':>9}  log")
+    for r in results:
+        status = ("skipped" if r['skipped'] else "ok") if r['ok'] else "FAILED"
+        logger.info(f"{r['quarter']:<10} {status:<7} {r['rows']:>12,} {r['errors']:>9,} {r['chunks']:>7} {r['seconds']:>9.1f}  {r['log_file']}" + (f"  ({r['error']})" if r.get('error') else ""))
+    total_rows = sum(r['rows'] for r in results); failed = [r['quarter'] for r in results if not r['ok']]
+    serial_seconds = sum(r['seconds'] for r in results)
+    skipped = sum(1 for r in results if r['skipped'])
+    logger.info(f"Quarters: {len(results)} ({len(results) - len(failed) - skipped} imported, {skipped} unchanged/skipped, {len(failed)} failed{': ' + ', '.join(failed) if failed else ''})")
+    logger.info(f"Rows submitted: {total_rows:,}, rows skipped due to errors: {sum(r['errors'] for r in results):,}, rows dropped by tag profile: {sum(r['dropped'] for r in results):,}")
+    write_totals = {k: sum(r.get('write_counts', {}).get(k, 0) for r in results) for k in ('inserted', 'changed', 'unchanged')}
+    if any(write_totals.values()): logger.info(f"Anti-join writes: {write_totals['inserted']:,} inserted, {write_totals['changed']:,} changed, {write_totals['unchanged']:,} unchanged")
+    logger.info(f"Wall time: {elapsed:.1f}s ({total_rows / elapsed if elapsed else 0:,.0f} rows/s), sum of quarter times: {serial_seconds:.1f}s")
+    logger.info("==================================================")
+
+# --- Main Execution ---
+def main():
+    parser = argparse.ArgumentParser(description="Import several SEC FSDS quarters in parallel with importSECData_AllForms.")
+    parser.add_argument("quarters", nargs="+", help="Quarter names (2018q3), folders, .zip archives or glob patterns (quote them)")
+    parser.add_argument("--base-dir", default=".", help="Directory that quarter names / relative patterns are resolved against. Default: .")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Quarters imported concurrently (processes). Default: {DEFAULT_WORKERS}")
+    parser.add_argument("--max-db-writers", type=int, default=DEFAULT_MAX_DB_WRITERS, help=f"Max quarters writing to the DB at the same time. Default: {DEFAULT_MAX_DB_WRITERS}")
+    parser.add_argument("--log-dir", default=".", help="Directory for the per-quarter <YYYYqN>.log files. Default: .")
+    parser.add_argument("--log-file", default=DEFAULT_RUNNER_LOG, help=f"Runner log with the combined summary. Default: {DEFAULT_RUNNER_LOG}")
+    parser.add_argument("--load-mode", choices=importer.LOAD_MODES, default=importer.DEFAULT_LOAD_MODE, help=f"Passed to each quarter import. Default: {importer.DEFAULT_LOAD_MODE}")
+    parser.add_argument("--tag-profile", choices=importer.TAG_PROFILES, default=importer.DEFAULT_TAG_PROFILE, help=f"Tags to import ('file' needs --tag-file). Default: {importer.DEFAULT_TAG_PROFILE}")
+    parser.add_argument("--tag-file", help="Tag list for --tag-profile file: one tag per line, '#' comments")
+    parser.add_argument("--force", action="store_true", help=f"Re-import quarters that {importer.MANIFEST_TABLE} lists as complete and unchanged")
+    args = parser.parse_args()
+    if args.workers < 1 or args.max_db_writers < 1: parser.error("--workers and --max-db-writers must be at least 1")
+    if (args.tag_profile == 'file') != bool(args.tag_file): parser.error("--tag-file goes with --tag-profile file")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)-8s - %(message)s',
+                        handlers=[logging.FileHandler(args.log_file, mode='a'), logging.StreamHandler()])
+    os.makedirs(args.log_dir, exist_ok=True)
+
+    quarters = resolve_quarters(args.quarters, args.base_dir)
+    if not quarters: logger.critical("No quarters to import. Exiting."); raise SystemExit(1)
+    workers = min(args.workers, len(quarters))
+    logger.info(f"Importing {len(quarters)} quarter(s) with {workers} worker(s), at most {args.max_db_writers} writing to {importer.DB_TABLE} at once: {', '.join(quarter_label(q) for q in quarters)}")
+
+    start_time = time.time()
+    results: Dict[str, Dict[str, Any]] = {}
+    write_slots = multiprocessing.BoundedSemaphore(args.max_db_writers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(write_slots,)) as pool:
+        futures = {pool.submit(import_quarter, q, args.log_dir, args.load_mode, args.force, args.tag_profile, args.tag_file): q for q in quarters}
+        for future in as_completed(futures):
+            path = futures[future]
+            try: result = future.result()
+            except Exception as e: result = {'source': path, 'quarter': quarter_label(path), 'ok': False, 'skipped': False, 'rows': 0, 'errors': 0, 'dropped': 0, 'chunks': 0, 'seconds': 0.0, 'log_file': os.path.join(args.log_dir, f"{quarter_label(path)}.log"), 'error': repr(e)}
+            results[path] = result
+            logger.info(f"[{len(results)}/{len(quarters)}] {result['quarter']}: {('skipped (unchanged)' if result['skipped'] else 'ok') if result['ok'] else 'FAILED'}, {result['rows']:,} rows in {result['seconds']:.1f}s (log: {result['log_file']})")
+
+    log_combined_summary([results[q] for q in quarters], time.time() - start_time)
+    raise SystemExit(0 if all(r['ok'] for r in results.values()) else 1)
+
+if __name__ == "__main__":
+    main()
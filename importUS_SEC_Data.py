@@ -1,5 +1,6 @@
 import requests
 import pandas as pd
+import numpy as np
 import time
 import logging
 import mysql.connector
@@ -10,6 +11,9 @@ import json
 from decimal import Decimal, InvalidOperation # Use Decimal for precision
 import argparse # Import argparse
 from datetime import datetime, timedelta # Import timedelta
+from itertools import compress
+# Column-wise row builder shared with importSECData_AllForms.py (one copy to fix)
+from importSECData_AllForms import build_submission_frame, column_values, format_date_column, quantized_value_column
 
 # --- Configuration ---
 SOURCE_API_NAME = "SEC_XBRL_Dataset"
@@ -29,6 +33,8 @@ INSERT_BATCH_SIZE = 5000 # Insert rows into DB in batches of this size
 # TARGET_FORMS removed - processing all forms
 TARGET_UOM = 'USD' # Focus on USD values primarily
 MAX_DECIMAL_PLACES = 4 # For storing values
+NUMERIC_COLUMNS = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
+SUBMISSION_COLUMNS = [ "cik", "form", "period", "fy", "fp" ] # Joined onto num.txt rows from sub.txt
 
 # --- FCF Calculation Configuration ---
 CFO_TAGS: Set[str] = {
@@ -73,16 +79,6 @@ def parse_decimal(value_str: Any) -> Optional[Decimal]:
     try: d = Decimal(str(value_str)); return d.quantize(Decimal('1e-' + str(MAX_DECIMAL_PLACES)))
     except (InvalidOperation, TypeError, ValueError): return None
 
-def format_date(date_val: Any) -> Optional[str]:
-    """Safely format date values to YYYY-MM-DD string."""
-    if pd.isna(date_val): return None
-    try:
-        if isinstance(date_val, (int, float)): date_str = str(int(date_val)); return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}" if len(date_str) == 8 else None
-        elif isinstance(date_val, str): return pd.to_datetime(date_val).strftime('%Y-%m-%d')
-        elif isinstance(date_val, (datetime, pd.Timestamp)): return date_val.strftime('%Y-%m-%d')
-    except Exception: pass
-    return None
-
 # --- Data Loading and Processing ---
 def load_submissions(filepath: str) -> Optional[pd.DataFrame]:
     """Loads the sub.txt file into a pandas DataFrame."""
@@ -98,51 +94,49 @@ def load_submissions(filepath: str) -> Optional[pd.DataFrame]:
         return sub_df
     except Exception as e: logger.critical(f"Error loading submission file {filepath}: {e}", exc_info=True); return None
 
-def process_numeric_chunk(chunk_df: pd.DataFrame, sub_map: Dict[str, Dict], connection) -> Tuple[int, int]:
-    """Processes a chunk of num.txt, calculates FCF, and inserts into DB."""
+def process_numeric_chunk(chunk_df: pd.DataFrame, sub_frame: pd.DataFrame, connection) -> Tuple[int, int]:
+    """Processes a chunk of num.txt, calculates FCF, and inserts into DB.
+    Column-wise: the chunk is joined to sub_frame on adsh, dates and values are converted as whole
+    columns and the insert tuples are zipped in one pass."""
     logger.debug(f"Processing chunk of {len(chunk_df)} numeric rows...")
-    insert_count = 0; error_count = 0; rows_to_insert = []
+    insert_count = 0; error_count = 0
 
-    relevant_chunk = chunk_df[chunk_df['adsh'].isin(sub_map.keys())].copy()
-    relevant_chunk = relevant_chunk[
-        (relevant_chunk['qtrs'].isin([0, 1, 4])) &
-        (relevant_chunk['uom'] == TARGET_UOM)
-    ].copy()
+    relevant_chunk = chunk_df[
+        (chunk_df['adsh'].isin(sub_frame.index)) &
+        (chunk_df['qtrs'].isin([0, 1, 4])) &
+        (chunk_df['uom'] == TARGET_UOM)
+    ].join(sub_frame, on='adsh')
 
-    logger.debug(f"Chunk filtered to {len(relevant_chunk)} potentially relevant rows (adsh in sub_map, qtrs 0/1/4, USD).")
+    logger.debug(f"Chunk filtered to {len(relevant_chunk)} potentially relevant rows (adsh in sub.txt, qtrs 0/1/4, USD).")
     if relevant_chunk.empty: return 0, 0
 
-    fcf_candidates = {}
-    for row in relevant_chunk.itertuples(index=False):
-        val: Optional[Decimal] = None; adsh = row.adsh; tag = row.tag; qtrs = row.qtrs; ddate_str = format_date(row.ddate);
+    ddates = format_date_column(relevant_chunk['ddate'])
+    value_column, keep = quantized_value_column(relevant_chunk['value'])
+    columns = {"ddate": ddates, "value": value_column}
+    for col in NUMERIC_COLUMNS:
+        if col not in columns: columns[col] = column_values(relevant_chunk.get(col), len(relevant_chunk))
+    keep = [k and d is not None for k, d in zip(keep, ddates)]
+    rows_to_insert = list(compress(zip(*(columns[col] for col in NUMERIC_COLUMNS)), keep))
+
+    # FCF candidates: only annual CFO/CapEx rows, in chunk order (first value per (adsh, year) wins)
+    fcf_candidates = {}; fcf_sub_rows = {}
+    candidate_mask = (relevant_chunk['qtrs'] == 4) & (relevant_chunk['tag'].isin(CFO_TAGS | CAPEX_TAGS))
+    candidate_rows = np.flatnonzero(candidate_mask.to_numpy()).tolist()
+    candidate_values = relevant_chunk['value'].iloc[candidate_rows].tolist()
+    for i, raw_value in zip(candidate_rows, candidate_values):
+        adsh = columns['adsh'][i]; tag = columns['tag'][i]; ddate_str = ddates[i]
         if not ddate_str: continue
         try:
-            year = int(ddate_str[:4]); val = parse_decimal(row.value);
+            year = int(ddate_str[:4]); val = parse_decimal(raw_value);
             if val is None: continue
-            key = (adsh, year);
-            if qtrs == 4:
-                if tag in CFO_TAGS:
-                    if key not in fcf_candidates: fcf_candidates[key] = {}
-                    if 'cfo' not in fcf_candidates[key]: fcf_candidates[key]['cfo'] = val; logger.debug(f"Found potential Annual CFO for {key}: {val}")
-                elif tag in CAPEX_TAGS:
-                    if key not in fcf_candidates: fcf_candidates[key] = {}
-                    if 'capex' not in fcf_candidates[key]: fcf_candidates[key]['capex'] = val; logger.debug(f"Found potential Annual CapEx for {key}: {val}")
-        except Exception as e: logger.error(f"Error processing row during FCF candidate collection: {row}. Error: {e}", exc_info=False); continue
-
-    for row in relevant_chunk.itertuples(index=False):
-        value: Optional[Decimal] = None; adsh = row.adsh; sub_info = sub_map.get(adsh);
-        if not sub_info: continue
-        ddate_str = format_date(row.ddate);
-        if not ddate_str: continue
-        try:
-            year = int(ddate_str[:4]); tag = row.tag; version = row.version; qtrs = row.qtrs; uom = row.uom;
-            coreg = getattr(row, 'coreg', None); footnote = getattr(row, 'footnote', None); value = parse_decimal(row.value);
-            if value is None: continue
-            row_data = { "adsh": adsh, "tag": tag, "version": version, "ddate": ddate_str, "qtrs": qtrs, "uom": uom, "value": value, "coreg": coreg, "footnote": footnote, "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
-            cols_order = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-            row_tuple = tuple(row_data.get(col) if not pd.isna(row_data.get(col)) else None for col in cols_order)
-            rows_to_insert.append(row_tuple)
-        except Exception as e: logger.error(f"Error preparing row for insertion: {row}. Error: {e}", exc_info=False); continue
+            key = (adsh, year); fcf_sub_rows.setdefault(adsh, i)
+            if tag in CFO_TAGS:
+                if key not in fcf_candidates: fcf_candidates[key] = {}
+                if 'cfo' not in fcf_candidates[key]: fcf_candidates[key]['cfo'] = val; logger.debug(f"Found potential Annual CFO for {key}: {val}")
+            elif tag in CAPEX_TAGS:
+                if key not in fcf_candidates: fcf_candidates[key] = {}
+                if 'capex' not in fcf_candidates[key]: fcf_candidates[key]['capex'] = val; logger.debug(f"Found potential Annual CapEx for {key}: {val}")
+        except Exception as e: logger.error(f"Error processing row during FCF candidate collection: {adsh} {tag} {ddate_str}. Error: {e}", exc_info=False); continue
 
     fcf_rows_to_insert = []
     for (adsh, year), values in fcf_candidates.items():
@@ -151,16 +145,13 @@ def process_numeric_chunk(chunk_df: pd.DataFrame, sub_map: Dict[str, Dict], conn
                 fcf_value = FCF_CALCULATION_METHOD(values['cfo'], values['capex'])
                 fcf_value_sql = fcf_value
                 logger.info(f"[{adsh}-{year}] Calculated FCF: {values['cfo']} + {values['capex']} = {fcf_value_sql}")
-                sub_info = sub_map.get(adsh);
-                if sub_info:
-                    period_date_str = format_date(sub_info['period']); period_year = int(period_date_str[:4]) if period_date_str else 0
-                    accurate_ddate = period_date_str if period_year == year else f"{year}-12-31"
-                    fcf_tag = "CalculatedFreeCashFlow"; fcf_version = "custom/internal";
-                    fcf_row_data = { "adsh": adsh, "tag": fcf_tag, "version": fcf_version, "ddate": accurate_ddate, "qtrs": 4, "uom": TARGET_UOM, "value": fcf_value_sql, "coreg": None, "footnote": "Calculated as CFO + CapEx", "cik": sub_info['cik'], "form": sub_info['form'], "period": format_date(sub_info['period']), "fy": sub_info['fy'], "fp": sub_info['fp'] }
-                    cols_order = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-                    fcf_tuple = tuple(fcf_row_data.get(col) if not pd.isna(fcf_row_data.get(col)) else None for col in cols_order)
-                    fcf_rows_to_insert.append(fcf_tuple)
-                else: logger.warning(f"No sub_info for {adsh} to create FCF record for {year}")
+                sub_row = fcf_sub_rows[adsh]
+                period_date_str = columns['period'][sub_row]; period_year = int(period_date_str[:4]) if period_date_str else 0
+                accurate_ddate = period_date_str if period_year == year else f"{year}-12-31"
+                fcf_tag = "CalculatedFreeCashFlow"; fcf_version = "custom/internal";
+                fcf_row_data = { "adsh": adsh, "tag": fcf_tag, "version": fcf_version, "ddate": accurate_ddate, "qtrs": 4, "uom": TARGET_UOM, "value": fcf_value_sql, "coreg": None, "footnote": "Calculated as CFO + CapEx", **{col: columns[col][sub_row] for col in SUBMISSION_COLUMNS} }
+                fcf_tuple = tuple(fcf_row_data.get(col) if not pd.isna(fcf_row_data.get(col)) else None for col in NUMERIC_COLUMNS)
+                fcf_rows_to_insert.append(fcf_tuple)
             except Exception as e: logger.error(f"Error calculating or preparing FCF for {adsh}-{year}: {e}")
 
     all_rows_to_insert = rows_to_insert + fcf_rows_to_insert
@@ -169,8 +160,7 @@ def process_numeric_chunk(chunk_df: pd.DataFrame, sub_map: Dict[str, Dict], conn
     cursor = None; i = 0; batch_cleaned = []
     try:
         cursor = connection.cursor(prepared=False)
-        cols = [ "adsh", "tag", "version", "ddate", "qtrs", "uom", "value", "coreg", "footnote", "cik", "form", "period", "fy", "fp" ]
-        sql = f"INSERT INTO {DB_TABLE} (`{'`, `'.join(cols)}`) VALUES ({', '.join(['%s'] * len(cols))}) ON DUPLICATE KEY UPDATE value = VALUES(value), footnote = VALUES(footnote), cik = VALUES(cik), form = VALUES(form), period = VALUES(period), fy = VALUES(fy), fp = VALUES(fp), imported_at = NOW(), updated_at = NOW();"
+        sql = f"INSERT INTO {DB_TABLE} (`{'`, `'.join(NUMERIC_COLUMNS)}`) VALUES ({', '.join(['%s'] * len(NUMERIC_COLUMNS))}) ON DUPLICATE KEY UPDATE value = VALUES(value), footnote = VALUES(footnote), cik = VALUES(cik), form = VALUES(form), period = VALUES(period), fy = VALUES(fy), fp = VALUES(fp), imported_at = NOW(), updated_at = NOW();"
         processed_rows_count = 0
         for i in range(0, len(all_rows_to_insert), INSERT_BATCH_SIZE):
             batch_raw = all_rows_to_insert[i : i + INSERT_BATCH_SIZE]
@@ -225,8 +215,8 @@ def main():
     try:
         sub_df = load_submissions(sub_file)
         if sub_df is None: logger.critical("Failed to load submission data. Exiting."); return
-        sub_map = sub_df.set_index('adsh').to_dict('index')
-        logger.info(f"Created submission map for {len(sub_map)} filings (all forms).")
+        sub_frame = build_submission_frame(sub_df)
+        logger.info(f"Indexed {len(sub_frame)} filings (all forms) for the num.txt join.")
         del sub_df # Free memory
 
         logger.info(f"Processing numeric data from {num_file} in chunks of {CHUNK_SIZE}...")
@@ -242,7 +232,7 @@ def main():
         for chunk in num_iterator:
             chunk_num += 1
             logger.info(f"--- Processing Chunk {chunk_num} ---")
-            processed_in_chunk, errors_in_chunk = process_numeric_chunk(chunk, sub_map, db_connection)
+            processed_in_chunk, errors_in_chunk = process_numeric_chunk(chunk, sub_frame, db_connection)
             total_processed_rows += processed_in_chunk
             total_errors += errors_in_chunk
             # time.sleep(0.05) # Optional delay
@@ -17,13 +17,6 @@
 
 python3 -m venv myenv && source myenv/bin/activate && pip install pandas
 
-function run_import {
-  service_name="$1"
-  echo "Processing service: $service_name"
-
-  python3 importSECData_AllForms.py --data-dir /media/devmon/Kay/us_data/"$service_name" --log-file "$service_name".log
-
-}
 
 services=(
 "2018q3"
@@ -57,11 +50,12 @@ services=(
 
 echo "start"
 
-for service in "${services[@]}"; do
-  run_import "$service"
-done
+# One python process pool for all quarters (per-quarter <quarter>.log files, combined summary at the end);
+# see importSECQuarters.py --help for --workers / --max-db-writers.
+python3 importSECQuarters.py --base-dir /media/devmon/Kay/us_data "${services[@]}"
+status=$?
 
 echo "end..."
 
-# Exit with a specific status code
-exit 0
+# Exit with the runner's status code (non-zero if any quarter failed)
+exit $status
@@ -0,0 +1,17 @@
+-- Import manifest for importSECData_AllForms.py / importSECQuarters.py: one row per FSDS quarter.
+-- sub_/num_ hash is 'sha256:<hex>' for plain files or 'crc32:<hex>' (from the zip directory) for archives.
+-- last_committed_chunk counts num.txt chunks of chunk_size rows already written; status is running/complete/failed/interrupted.
+-- A complete quarter is skipped when its files are unchanged and it was imported with tag profile 'all' or the same profile.
+-- importSECData_AllForms.py creates this table itself if it does not exist (and adds tag_profile/rows_dropped_by_tag to older ones).
+CREATE TABLE IF NOT EXISTS nextcloud.sec_import_manifest (
+    quarter VARCHAR(16) NOT NULL PRIMARY KEY COMMENT 'YYYYqN (data dir / archive name)',
+    source VARCHAR(512) NULL,
+    sub_size BIGINT NULL, sub_mtime DOUBLE NULL, sub_hash VARCHAR(80) NULL,
+    num_size BIGINT NULL, num_mtime DOUBLE NULL, num_hash VARCHAR(80) NULL,
+    sub_rows INT NULL, num_rows BIGINT NULL, rows_submitted BIGINT NULL, rows_failed BIGINT NULL,
+    chunk_size INT NULL, last_committed_chunk INT NOT NULL DEFAULT 0,
+    tag_profile VARCHAR(64) NULL COMMENT 'all, or mapped:/file:<hash of the tag list> (--tag-profile)', rows_dropped_by_tag BIGINT NULL,
+    status VARCHAR(16) NOT NULL,
+    started_at TIMESTAMP NULL, finished_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) COMMENT 'Which SEC FSDS quarters were imported into sec_numeric_data, from which files, and how far';
@@ -0,0 +1,61 @@
+# <<< sec_tag_map.py >>>
+# XBRL tag configuration shared by importSECData_AllForms.py (--tag-profile mapped, CalculatedFreeCashFlow inputs)
+# and transformSECToPeriods.py (tag -> company_financial_periods column mapping).
+# Constants only: importing it has no side effects (no logging setup, no DB driver).
+
+from typing import Set
+
+# --- Tag Mapping Configuration ---
+# !!! CRITICAL: This mapping needs careful refinement based on tag.txt and data exploration !!!
+# Map target table column names to potential SEC XBRL tags
+# Prioritize common/standard tags first in the list for each concept
+TAG_MAP = {
+    # Income Statement
+    'revenue': ['Revenues', 'RevenueFromContractWithCustomerExcludingAssessedTax', 'SalesRevenueNet'],
+    'cost_of_revenue': ['CostOfRevenue', 'CostOfGoodsAndServicesSold'],
+    'gross_profit': ['GrossProfit'],
+    'research_and_development_expense': ['ResearchAndDevelopmentExpense'],
+    'selling_general_and_administrative_expense': ['SellingGeneralAndAdministrativeExpense'],
+    'operating_income_loss': ['OperatingIncomeLoss'],
+    'interest_expense': ['InterestExpense'],
+    'income_tax_expense_benefit': ['IncomeTaxExpenseBenefit'],
+    'net_income_loss': ['NetIncomeLoss', 'ProfitLoss'],
+    'eps_basic': ['EarningsPerShareBasic'],
+    'eps_diluted': ['EarningsPerShareDiluted'],
+    'ebitda': ['EBITDA'], # Use direct tag if available
+
+    # Balance Sheet
+    'cash_and_cash_equivalents': ['CashAndCashEquivalentsAtCarryingValue'],
+    'accounts_receivable_net_current': ['AccountsReceivableNetCurrent'],
+    'inventory_net': ['InventoryNet'],
+    'total_current_assets': ['AssetsCurrent'],
+    'property_plant_and_equipment_net': ['PropertyPlantAndEquipmentNet'],
+    'total_assets': ['Assets'],
+    'accounts_payable_current': ['AccountsPayableCurrent'],
+    'short_term_debt': ['ShortTermDebt', 'DebtCurrent', 'CurrentPortionOfLongTermDebt'], # Example: Needs logic to combine if split
+    'total_current_liabilities': ['LiabilitiesCurrent'],
+    'long_term_debt': ['LongTermDebt', 'LongTermDebtNoncurrent'],
+    'total_liabilities': ['Liabilities'],
+    'total_stockholders_equity': ['StockholdersEquity', 'EquityAttributableToParent'],
+
+    # Cash Flow
+    'net_cash_provided_by_used_in_operating_activities': ['NetCashProvidedByUsedInOperatingActivities', 'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'], # CFO
+    'depreciation_and_amortization': ['DepreciationAndAmortization', 'DepreciationDepletionAndAmortization'], # Check IS/CF source? Use CF priority?
+    'capital_expenditure': ['PaymentsToAcquirePropertyPlantAndEquipment', 'PurchaseOfPropertyPlantAndEquipment', 'PaymentsToAcquireProductiveAssets'], # CapEx
+    'net_cash_provided_by_used_in_investing_activities': ['NetCashProvidedByUsedInInvestingActivities'],
+    'net_cash_provided_by_used_in_financing_activities': ['NetCashProvidedByUsedInFinancingActivities'],
+    'dividends_paid': ['PaymentsOfDividends', 'DividendsPaid'], # Usually negative
+    'free_cash_flow': ['FreeCashFlow'], # FMP/SEC direct reported FCF
+}
+
+# --- FCF Input Tags ---
+# Annual facts paired per filing/year into CalculatedFreeCashFlow (CFO + CapEx) by the importer
+CFO_TAGS: Set[str] = {
+    'NetCashProvidedByUsedInOperatingActivities',
+    'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations',
+}
+CAPEX_TAGS: Set[str] = {
+    'PaymentsToAcquirePropertyPlantAndEquipment',
+    'PurchaseOfPropertyPlantAndEquipment',
+    'PaymentsToAcquireProductiveAssets',
+}
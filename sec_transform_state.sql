@@ -0,0 +1,12 @@
+-- Watermark for transformSECToPeriods.py: one row per transform (transform_name = target table).
+-- watermark is MAX(sec_numeric_data.updated_at) as of the last run without errors; the next run without --full
+-- re-transforms only CIKs whose mapped USD facts were inserted/updated after it.
+-- transformSECToPeriods.py creates this table itself if it does not exist.
+CREATE TABLE IF NOT EXISTS nextcloud.sec_transform_state (
+    transform_name VARCHAR(64) NOT NULL PRIMARY KEY COMMENT 'e.g. company_financial_periods',
+    watermark TIMESTAMP NULL COMMENT 'Source updated_at high-water mark already transformed',
+    mode VARCHAR(16) NULL COMMENT 'full or incremental (last successful run)',
+    ciks_processed INT NULL, periods_upserted BIGINT NULL,
+    started_at TIMESTAMP NULL, finished_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) COMMENT 'How far transformSECToPeriods.py has processed sec_numeric_data';
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import time
 import logging
 import mysql.connector
@@ -8,7 +9,12 @@ import os
 import json
 from decimal import Decimal, InvalidOperation
 import argparse
-from datetime import datetime
+import multiprocessing
+import multiprocessing.util # Finalize: close each worker's connection when the pool shuts it down
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from sec_tag_map import TAG_MAP
 
 # --- Configuration ---
 SOURCE_TABLE = "sec_numeric_data"
@@ -20,48 +26,41 @@ CIK_BATCH_SIZE = 100
 # How many rows (company-periods) to insert/update in DB at once
 INSERT_BATCH_SIZE = 1000
 
+# --- Incremental Transform Configuration ---
+# The high-water mark is MAX(sec_numeric_data.updated_at) seen by the last successful run (kept in
+# TRANSFORM_STATE_TABLE, see sec_transform_state.sql). Without --full only CIKs with mapped USD facts
+# inserted/updated after it are re-transformed. The overlap re-reads a few minutes before the mark so
+# rows committed late by a long-running import (timestamped before the mark) are not missed.
+TRANSFORM_STATE_TABLE = "sec_transform_state"
+TRANSFORM_NAME = TARGET_TABLE # Key of this transform's row in TRANSFORM_STATE_TABLE
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# --- Fact Fetch Configuration ---
+# A CIK batch is fetched, pivoted and upserted in pieces of at most FETCH_MAX_ROWS facts, planned from an index-only
+# COUNT per (cik, ddate): whole CIKs share a piece, a large filer alone is split at ddate boundaries (a period never
+# spans pieces). Each piece streams through an unbuffered cursor FETCH_BLOCK_ROWS rows at a time; every block of row
+# tuples is typed right away (value float64, dates datetime64, strings category), so memory is bounded by the piece.
+FETCH_MAX_ROWS = 1_000_000
+FETCH_BLOCK_ROWS = 20000
+FETCH_COLUMNS = ['cik', 'adsh', 'form', 'period', 'fy', 'fp', 'ddate', 'qtrs', 'tag', 'version', 'uom', 'value']
+FETCH_DATE_COLUMNS = ['period', 'ddate']
+FETCH_CATEGORY_COLUMNS = ['adsh', 'form', 'fp', 'tag', 'version', 'uom'] # Few distinct values per piece
+
+# --- Parallel Transform Configuration ---
+# --workers N runs CIK batches in N processes, each with its own DB connection (fetch and pandas pivot
+# overlap across cores); at most --max-db-writers of them upsert into TARGET_TABLE at the same time.
+DEFAULT_WORKERS = 1
+DEFAULT_MAX_DB_WRITERS = 2
+
+# --- Transform Engine Configuration ---
+# 'pandas': fetch the long-format facts and pivot them in Python (fetch_data_for_ciks + transform_data + upsert).
+# 'sql': one INSERT ... SELECT ... GROUP BY per CIK batch; MariaDB pivots with COALESCE(MAX(CASE ...)) columns
+# built from TAG_MAP and writes company_financial_periods directly, so no fact rows cross the network.
+ENGINES = ('pandas', 'sql')
+DEFAULT_ENGINE = 'pandas'
+
 # --- Tag Mapping Configuration ---
-# !!! CRITICAL: This mapping needs careful refinement based on tag.txt and data exploration !!!
-# Map target table column names to potential SEC XBRL tags
-# Prioritize common/standard tags first in the list for each concept
-TAG_MAP = {
-    # Income Statement
-    'revenue': ['Revenues', 'RevenueFromContractWithCustomerExcludingAssessedTax', 'SalesRevenueNet'],
-    'cost_of_revenue': ['CostOfRevenue', 'CostOfGoodsAndServicesSold'],
-    'gross_profit': ['GrossProfit'],
-    'research_and_development_expense': ['ResearchAndDevelopmentExpense'],
-    'selling_general_and_administrative_expense': ['SellingGeneralAndAdministrativeExpense'],
-    'operating_income_loss': ['OperatingIncomeLoss'],
-    'interest_expense': ['InterestExpense'],
-    'income_tax_expense_benefit': ['IncomeTaxExpenseBenefit'],
-    'net_income_loss': ['NetIncomeLoss', 'ProfitLoss'],
-    'eps_basic': ['EarningsPerShareBasic'],
-    'eps_diluted': ['EarningsPerShareDiluted'],
-    'ebitda': ['EBITDA'], # Use direct tag if available
-
-    # Balance Sheet
-    'cash_and_cash_equivalents': ['CashAndCashEquivalentsAtCarryingValue'],
-    'accounts_receivable_net_current': ['AccountsReceivableNetCurrent'],
-    'inventory_net': ['InventoryNet'],
-    'total_current_assets': ['AssetsCurrent'],
-    'property_plant_and_equipment_net': ['PropertyPlantAndEquipmentNet'],
-    'total_assets': ['Assets'],
-    'accounts_payable_current': ['AccountsPayableCurrent'],
-    'short_term_debt': ['ShortTermDebt', 'DebtCurrent', 'CurrentPortionOfLongTermDebt'], # Example: Needs logic to combine if split
-    'total_current_liabilities': ['LiabilitiesCurrent'],
-    'long_term_debt': ['LongTermDebt', 'LongTermDebtNoncurrent'],
-    'total_liabilities': ['Liabilities'],
-    'total_stockholders_equity': ['StockholdersEquity', 'EquityAttributableToParent'],
-
-    # Cash Flow
-    'net_cash_provided_by_used_in_operating_activities': ['NetCashProvidedByUsedInOperatingActivities', 'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'], # CFO
-    'depreciation_and_amortization': ['DepreciationAndAmortization', 'DepreciationDepletionAndAmortization'], # Check IS/CF source? Use CF priority?
-    'capital_expenditure': ['PaymentsToAcquirePropertyPlantAndEquipment', 'PurchaseOfPropertyPlantAndEquipment', 'PaymentsToAcquireProductiveAssets'], # CapEx
-    'net_cash_provided_by_used_in_investing_activities': ['NetCashProvidedByUsedInInvestingActivities'],
-    'net_cash_provided_by_used_in_financing_activities': ['NetCashProvidedByUsedInFinancingActivities'],
-    'dividends_paid': ['PaymentsOfDividends', 'DividendsPaid'], # Usually negative
-    'free_cash_flow': ['FreeCashFlow'], # FMP/SEC direct reported FCF
-}
+# TAG_MAP (target column -> candidate XBRL tags, in priority order) lives in sec_tag_map.py, shared with the importer
 
 # --- Database Configuration --- (Same as before)
 DB_HOST = os.environ.get("DB_HOST", "192.168.1.142")
@@ -93,18 +92,76 @@ def create_db_connection() -> Optional[mysql.connector.MySQLConnection]:
     except Exception as e: logger.error(f"Unexpected error during DB connection: {e}")
     return connection
 
+# --- Transform State (Watermark) ---
+TRANSFORM_STATE_DDL = f"""CREATE TABLE IF NOT EXISTS {TRANSFORM_STATE_TABLE} (
+    transform_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    watermark TIMESTAMP NULL, mode VARCHAR(16) NULL,
+    ciks_processed INT NULL, periods_upserted BIGINT NULL,
+    started_at TIMESTAMP NULL, finished_at TIMESTAMP NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+)""" # Same definition as sec_transform_state.sql
+
+def read_transform_state(connection) -> Optional[Dict[str, Any]]:
+    """ This transform's row of TRANSFORM_STATE_TABLE (created if missing), or None before the first run. """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute(TRANSFORM_STATE_DDL)
+        cursor.execute(f"SELECT * FROM {TRANSFORM_STATE_TABLE} WHERE transform_name = %s", (TRANSFORM_NAME,))
+        return cursor.fetchone()
+    finally: cursor.close()
+
+def write_transform_state(connection, **fields: Any) -> bool:
+    """ Upserts the given state columns; only called after a run without errors. True once committed. """
+    sql = (f"INSERT INTO {TRANSFORM_STATE_TABLE} (transform_name, {', '.join(fields)}) VALUES ({', '.join(['%s'] * (len(fields) + 1))}) "
+           f"ON DUPLICATE KEY UPDATE {', '.join(f'{k} = VALUES({k})' for k in fields)}")
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql, (TRANSFORM_NAME, *fields.values()))
+        connection.commit()
+        return True
+    except Error as e: logger.error(f"Could not update {TRANSFORM_STATE_TABLE}: {e}"); return False
+    finally:
+        if cursor: cursor.close()
+
+def save_watermark(connection, **fields: Any) -> Tuple[Any, bool]:
+    """ write_transform_state on connection, reconnecting first if it dropped during a long run (e.g. wait_timeout
+    while --workers did all the work). Returns the connection to keep using and whether the state was written. """
+    if not connection or not connection.is_connected():
+        logger.warning("DB connection lost before saving the watermark. Reconnecting...")
+        connection = create_db_connection()
+        if not connection: logger.error(f"Reconnection failed; {TRANSFORM_STATE_TABLE} not updated."); return connection, False
+    return connection, write_transform_state(connection, **fields)
+
+def get_source_watermark(connection) -> Optional[datetime]:
+    """ Current MAX(updated_at) of the source table (uses idx_sec_updated_at). """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT MAX(updated_at) FROM {SOURCE_TABLE}")
+        return cursor.fetchone()[0]
+    finally: cursor.close()
+
 # --- Helper: Get Unique CIKs to Process ---
-def get_ciks_to_process(connection) -> List[int]:
-    """ Gets a list of unique CIKs from the source table. """
-    logger.info(f"Fetching unique CIKs from {SOURCE_TABLE}...")
-    ciks = []
+def get_ciks_to_process(connection, changed_after: Optional[datetime] = None, changed_until: Optional[datetime] = None) -> Optional[List[int]]:
+    """ Gets a list of unique CIKs from the source table: all of them, or (changed_after set) only those
+    with mapped USD facts whose updated_at is in (changed_after, changed_until]. None on DB error. """
+    logger.info(f"Fetching unique CIKs from {SOURCE_TABLE}" + (f" with facts changed after {changed_after}..." if changed_after else "..."))
+    ciks = None
     cursor = None
     try:
         cursor = connection.cursor()
-        # Query distinct CIKs, maybe filter for recently updated ones?
-        # For full transform, select all distinct CIKs.
-        sql = f"SELECT DISTINCT cik FROM {SOURCE_TABLE} ORDER BY cik"
-        cursor.execute(sql)
+        if changed_after is None:
+            # For full transform, select all distinct CIKs.
+            cursor.execute(f"SELECT DISTINCT cik FROM {SOURCE_TABLE} ORDER BY cik")
+        else:
+            all_tags_needed = fetched_tags()
+            sql = f"""
+                SELECT DISTINCT cik FROM {SOURCE_TABLE}
+                WHERE updated_at > %s AND updated_at <= %s -- Range scan on idx_sec_updated_at
+                  AND uom = 'USD' AND tag IN ({', '.join(['%s'] * len(all_tags_needed))})
+                ORDER BY cik
+            """
+            cursor.execute(sql, (changed_after, changed_until, *all_tags_needed))
         results = cursor.fetchall()
         ciks = [row[0] for row in results if row[0] is not None]
         logger.info(f"Found {len(ciks)} unique CIKs to process.")
@@ -117,37 +174,93 @@ def get_ciks_to_process(connection) -> List[int]:
     return ciks
 
 # --- Helper: Fetch Data for a Batch of CIKs ---
-def fetch_data_for_ciks(connection, cik_batch: List[int]) -> Optional[pd.DataFrame]:
-    """ Fetches all necessary data from sec_numeric_data for a batch of CIKs. """
+def fetched_tags() -> List[str]:
+    """ Every tag transform_data can use: all TAG_MAP candidates plus CalculatedFreeCashFlow from the import. """
+    return sorted(set(tag for tag_list in TAG_MAP.values() for tag in tag_list) | {'CalculatedFreeCashFlow'})
+
+def count_facts_by_date(connection, cik_batch: List[int]) -> Optional[List[Tuple[int, Any, int]]]:
+    """ (cik, ddate, facts) for the batch's mapped tags, ordered. Covered by idx_sec_cik_tag_date; the uom filter is
+    left out so it stays index-only (counts may include non-USD facts, which only makes pieces smaller). None on error. """
+    tags = fetched_tags(); cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT cik, ddate, COUNT(*) FROM {SOURCE_TABLE}
+            WHERE cik IN ({', '.join(['%s'] * len(cik_batch))}) AND tag IN ({', '.join(['%s'] * len(tags))})
+            GROUP BY cik, ddate ORDER BY cik, ddate
+        """, (*cik_batch, *tags))
+        return cursor.fetchall()
+    except Error as e: logger.error(f"DB error counting facts for CIK batch: {e}"); return None
+    finally:
+        if cursor: cursor.close()
+
+def plan_fetch_pieces(counts: List[Tuple[int, Any, int]], max_rows: int = FETCH_MAX_ROWS) -> List[Tuple[List[int], Optional[Tuple[Any, Any]]]]:
+    """ Groups count_facts_by_date rows into fetch pieces of at most max_rows facts: (ciks, None) for whole CIKs,
+    (ciks=[cik], (first ddate, last ddate)) for slices of a CIK with more than max_rows facts on its own. """
+    per_cik: Dict[int, List[Tuple[Any, int]]] = {}
+    for cik, ddate, facts in counts: per_cik.setdefault(cik, []).append((ddate, facts))
+    pieces, ciks, rows = [], [], 0
+    for cik, dates in per_cik.items():
+        total = sum(facts for _, facts in dates)
+        if rows + total > max_rows and ciks: pieces.append((ciks, None)); ciks, rows = [], 0
+        if total <= max_rows: ciks.append(cik); rows += total; continue
+        first, rows_in_slice = dates[0][0], 0 # Large filer: consecutive ddate ranges (a single oversized ddate stays whole)
+        for i, (ddate, facts) in enumerate(dates):
+            if rows_in_slice and rows_in_slice + facts > max_rows: pieces.append(([cik], (first, dates[i - 1][0]))); first, rows_in_slice = ddate, 0
+            rows_in_slice += facts
+        pieces.append(([cik], (first, dates[-1][0])))
+    if ciks: pieces.append((ciks, None))
+    return pieces
+
+def typed_fact_block(rows: List[tuple]) -> pd.DataFrame:
+    """ One fetchmany block as a typed frame: DECIMAL value -> float64, DATE -> datetime64, strings -> category. """
+    block = pd.DataFrame.from_records(rows, columns=FETCH_COLUMNS, coerce_float=True)
+    for col in FETCH_DATE_COLUMNS: block[col] = pd.to_datetime(block[col])
+    for col in FETCH_CATEGORY_COLUMNS: block[col] = block[col].astype('category')
+    return block
+
+def concat_fact_blocks(blocks: List[pd.DataFrame]) -> pd.DataFrame:
+    """ pd.concat that keeps the category columns categorical (blocks have different categories), sorted so
+    codes order like the strings. """
+    if not blocks: return pd.DataFrame(columns=FETCH_COLUMNS)
+    data = pd.concat([block.drop(columns=FETCH_CATEGORY_COLUMNS) for block in blocks], ignore_index=True)
+    for col in FETCH_CATEGORY_COLUMNS:
+        data[col] = pd.api.types.union_categoricals([block[col] for block in blocks], sort_categories=True)
+    return data[FETCH_COLUMNS]
+
+def fetch_data_for_ciks(connection, cik_batch: List[int], ddate_range: Optional[Tuple[Any, Any]] = None,
+                        block_rows: int = FETCH_BLOCK_ROWS) -> Optional[pd.DataFrame]:
+    """ Fetches all necessary data from sec_numeric_data for a batch of CIKs (or one fetch piece of it: ddate_range
+    restricts to those period end dates), streamed in typed blocks of block_rows. """
     if not cik_batch: return pd.DataFrame() # Return empty DataFrame if batch is empty
     logger.debug(f"Fetching data for CIK batch (size {len(cik_batch)})...")
     cursor = None
-    # Flatten the list of all tags we might need
-    all_tags_needed = set(tag for tag_list in TAG_MAP.values() for tag in tag_list)
-    # Add calculated FCF tag if it exists from previous script runs
-    all_tags_needed.add('CalculatedFreeCashFlow')
+    all_tags_needed = fetched_tags()
 
     try:
-        cursor = connection.cursor(dictionary=True)
+        cursor = connection.cursor(buffered=False) # Rows stay on the server until fetched; tuples, no per-row dicts
         # Using IN clause for CIKs and tags
         tag_placeholders = ', '.join(['%s'] * len(all_tags_needed))
         cik_placeholders = ', '.join(['%s'] * len(cik_batch))
         sql = f"""
-            SELECT
-                cik, adsh, form, period, fy, fp, -- Submission context
-                ddate, qtrs, tag, version, uom, value, -- Numeric fact context
-                updated_at -- To get the latest version if multiple exist for same key? No, PK handles this.
+            SELECT {', '.join(FETCH_COLUMNS)} -- Submission context, then numeric fact context
             FROM {SOURCE_TABLE}
             WHERE cik IN ({cik_placeholders})
               AND tag IN ({tag_placeholders})
               AND uom = 'USD' -- Filter UOM here
+              {'AND ddate BETWEEN %s AND %s' if ddate_range else ''}
             ORDER BY cik, ddate, qtrs -- Order for predictable processing
         """
-        params = tuple(cik_batch) + tuple(all_tags_needed)
+        params = tuple(cik_batch) + tuple(all_tags_needed) + tuple(ddate_range or ())
         cursor.execute(sql, params)
-        data = cursor.fetchall()
-        logger.debug(f"Fetched {len(data)} rows for {len(cik_batch)} CIKs.")
-        return pd.DataFrame(data)
+        blocks = []
+        while True:
+            rows = cursor.fetchmany(block_rows)
+            if not rows: break
+            blocks.append(typed_fact_block(rows))
+        data = concat_fact_blocks(blocks)
+        logger.debug(f"Fetched {len(data)} rows in {len(blocks)} block(s) for {len(cik_batch)} CIKs.")
+        return data
     except Error as e:
         logger.error(f"DB error fetching data for CIK batch: {e}")
         return None
@@ -155,12 +268,69 @@ def fetch_data_for_ciks(connection, cik_batch: List[int]) -> Optional[pd.DataFra
         logger.error(f"Unexpected error fetching data for CIK batch: {e}", exc_info=True)
         return None
     finally:
-        if cursor: cursor.close()
-
+        if cursor:
+            try: cursor.close()
+            except Error: connection.consume_results() # Stream abandoned mid-way: drain it so the connection stays usable
+
+
+# --- Helper: Pivot Long Facts to One Row per Period ---
+PIVOT_INDEX_COLUMNS = ['cik', 'adsh', 'form', 'period', 'fy', 'fp', 'ddate', 'qtrs', 'uom'] # Group by all context columns
+
+def pivot_facts_pandas(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """ The original pivot_table pivot (kept as the reference for benchmark_period_pivot.py). """
+    return raw_df.pivot_table(
+        index=PIVOT_INDEX_COLUMNS,
+        columns='tag',
+        values='value',
+        aggfunc='last' # If duplicate tag for same period, take the last one encountered
+    ).reset_index()
+
+def combined_codes(columns: List[pd.Series]) -> np.ndarray:
+    """ One int64 code per row for a multi-column key, ordered like the sorted key tuples (-1 where any
+    part is NULL). Per-column sorted factorize codes are combined mixed-radix; the running code is
+    compacted (np.unique) whenever the next radix would overflow int64. """
+    code, cardinality = np.zeros(len(columns[0]), dtype=np.int64), 1
+    missing = np.zeros(len(columns[0]), dtype=bool)
+    for column in columns:
+        codes, uniques = pd.factorize(column, sort=True)
+        missing |= codes < 0
+        if cardinality * len(uniques) >= 2 ** 62:
+            uniq, code = np.unique(code, return_inverse=True); cardinality = len(uniq)
+        code = code * len(uniques) + codes; cardinality *= len(uniques)
+    code[missing] = -1
+    return code
+
+def pivot_facts(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """ Same frame as pivot_facts_pandas without pivot_table: the period key and the tag are factorised
+    into integer codes and values are scattered into a preallocated (periods x tags) array, keeping the
+    last value per cell. Rows and tag columns come out sorted, NULL keys and values are dropped. """
+    period_codes = combined_codes([raw_df[col] for col in PIVOT_INDEX_COLUMNS])
+    tag_index, tags = pd.factorize(raw_df['tag'], sort=True)
+    values = raw_df['value'].to_numpy(dtype='float64', na_value=np.nan)
+    valid = (period_codes >= 0) & (tag_index >= 0) & ~np.isnan(values)
+    if not valid.any(): return pivot_facts_pandas(raw_df.iloc[0:0])
+    rows = np.flatnonzero(valid)
+    # Dense period numbers in sorted key order: hash-factorise the combined codes, then rank the (few) uniques
+    period_index, unique_periods = pd.factorize(period_codes[rows])
+    rank = np.empty(len(unique_periods), dtype=np.int64); rank[np.argsort(unique_periods)] = np.arange(len(unique_periods))
+    period_index = rank[period_index]
+    key_rows = np.empty(len(unique_periods), dtype=np.int64); key_rows[period_index] = rows # Any row of a period carries its key
+    # Last fact per (period, tag) cell: the highest row position written to it
+    cells = period_index * len(tags) + tag_index[rows]
+    last_row = np.full(len(unique_periods) * len(tags), -1, dtype=np.int64)
+    np.maximum.at(last_row, cells, rows)
+    filled = np.flatnonzero(last_row >= 0)
+    matrix = np.full((len(unique_periods), len(tags)), np.nan)
+    matrix.reshape(-1)[filled] = values[last_row[filled]]
+    used_tags = ~np.isnan(matrix).all(axis=0) # Tags seen only on dropped rows get no column, as with pivot_table
+    pivoted = raw_df[PIVOT_INDEX_COLUMNS].iloc[key_rows].reset_index(drop=True)
+    pivoted = pd.concat([pivoted, pd.DataFrame(matrix[:, used_tags], columns=pd.Index(tags[used_tags], name='tag'))], axis=1)
+    pivoted.columns.name = 'tag'
+    return pivoted
 
 # --- Helper: Transform Raw Data to Pivoted Format ---
-def transform_data(raw_df: pd.DataFrame) -> pd.DataFrame:
-    """ Pivots raw data and maps tags to structured columns. """
+def transform_data(raw_df: pd.DataFrame, pivot=pivot_facts) -> pd.DataFrame:
+    """ Pivots raw data and maps tags to structured columns (pivot: pivot_facts, or pivot_facts_pandas). """
     if raw_df.empty: return pd.DataFrame()
     logger.info(f"Pivoting and transforming {len(raw_df)} raw data rows...")
 
@@ -173,12 +343,7 @@ def transform_data(raw_df: pd.DataFrame) -> pd.DataFrame:
     # We group by cik, ddate, qtrs to get unique facts for a period end + duration
     # Pivot using these as index, tags as columns
     try:
-        pivoted = raw_df.pivot_table(
-            index=['cik', 'adsh', 'form', 'period', 'fy', 'fp', 'ddate', 'qtrs', 'uom'], # Group by all context columns
-            columns='tag',
-            values='value',
-            aggfunc='last' # If duplicate tag for same period, take the last one encountered
-        ).reset_index()
+        pivoted = pivot(raw_df)
         logger.info(f"Pivoted data shape: {pivoted.shape}")
     except Exception as e:
          logger.error(f"Error during pivot operation: {e}", exc_info=True)
@@ -348,20 +513,171 @@ def upsert_period_data(connection, period_data_df: pd.DataFrame):
         return total_processed, total_errors
 
 
+# --- SQL Engine: Pivot Inside MariaDB ---
+PERIOD_KEY_COLUMNS = {'cik', 'period_end_date', 'period_duration_qtrs'} # PRIMARY KEY of TARGET_TABLE
+CFO_COLUMN = 'net_cash_provided_by_used_in_operating_activities'
+CAPEX_COLUMN = 'capital_expenditure'
+
+def build_pivot_upsert_sql(table_columns: Set[str], cik_count: int) -> Tuple[str, List[Any]]:
+    """ INSERT ... SELECT that pivots one CIK batch of SOURCE_TABLE into TARGET_TABLE, and its parameters
+    (the CIKs follow them). Each TAG_MAP column is COALESCE(MAX(CASE WHEN tag = <tag> THEN value END), ...)
+    in the map's priority order, so a period falls back to the next tag only when it lacks the preferred one.
+    Rows are inserted ordered by the pivot key, so when several filings report the same
+    (cik, period_end_date, period_duration_qtrs) the last one wins, as with the pandas engine. """
+    mapped = {col: tags for col, tags in TAG_MAP.items() if col in table_columns}
+    params: List[Any] = [SOURCE_API_NAME_META]
+    pivot_exprs = []
+    for col, tags in mapped.items():
+        cases = [f"MAX(CASE WHEN tag = %s THEN value END)" for _ in tags]
+        pivot_exprs.append(f"{cases[0] if len(cases) == 1 else 'COALESCE(' + ', '.join(cases) + ')'} AS `{col}`")
+        params.extend(tags)
+    all_tags_needed = sorted(set(tag for tag_list in mapped.values() for tag in tag_list))
+    params.extend(all_tags_needed)
+    fcf_expr = f"CASE WHEN p.qtrs IN (1, 4) THEN p.`{CFO_COLUMN}` + p.`{CAPEX_COLUMN}` END" if {CFO_COLUMN, CAPEX_COLUMN} <= mapped.keys() else "NULL"
+    insert_cols = ['cik', 'period_end_date', 'period_duration_qtrs', 'fiscal_year', 'fiscal_period', 'adsh', 'form_type', 'currency', 'source_api', *mapped, 'calculated_fcf']
+    insert_cols = [col for col in insert_cols if col in table_columns]
+    select_exprs = {'cik': 'p.cik', 'period_end_date': 'p.ddate', 'period_duration_qtrs': 'p.qtrs', 'fiscal_year': 'p.fy', 'fiscal_period': 'p.fp',
+                    'adsh': 'p.adsh', 'form_type': 'p.form', 'currency': 'p.uom', 'source_api': '%s', 'calculated_fcf': fcf_expr,
+                    **{col: f"p.`{col}`" for col in mapped}}
+    if 'source_api' not in table_columns: params.pop(0)
+    context = ', '.join(PIVOT_INDEX_COLUMNS)
+    update_clause = ', '.join(f"`{col}`=VALUES(`{col}`)" for col in insert_cols if col not in PERIOD_KEY_COLUMNS) + ', updated_at=NOW()'
+    sql = f"""
+        INSERT INTO {TARGET_TABLE} (`{'`, `'.join(insert_cols)}`)
+        SELECT {', '.join(select_exprs[col] for col in insert_cols)}
+        FROM (
+            SELECT {context}, {', '.join(pivot_exprs)}
+            FROM {SOURCE_TABLE}
+            WHERE tag IN ({', '.join(['%s'] * len(all_tags_needed))})
+              AND uom = 'USD' AND value IS NOT NULL
+              AND form IS NOT NULL AND period IS NOT NULL AND fy IS NOT NULL AND fp IS NOT NULL -- pivot_table drops NULL group keys
+              AND cik IN ({', '.join(['%s'] * cik_count)})
+            GROUP BY {context}
+        ) p
+        ORDER BY {', '.join(f'p.{col}' for col in PIVOT_INDEX_COLUMNS)}
+        ON DUPLICATE KEY UPDATE {update_clause}
+    """
+    return sql, params
+
+def upsert_periods_in_db(connection, cik_batch: List[int]) -> Tuple[int, int]:
+    """ Pivots and upserts one CIK batch inside MariaDB (the 'sql' engine), committed once.
+    Returns (affected rows as reported by MariaDB: 1 per new period, 2 per updated one, failed batches). """
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DESCRIBE {TARGET_TABLE};")
+        table_columns = {row[0] for row in cursor.fetchall()}
+        sql, params = build_pivot_upsert_sql(table_columns, len(cik_batch))
+        cursor.execute(sql, (*params, *cik_batch))
+        connection.commit()
+        logger.debug(f"SQL pivot upsert for {len(cik_batch)} CIKs: {cursor.rowcount} rows affected.")
+        return cursor.rowcount, 0
+    except Error as e:
+        logger.error(f"DB error during SQL pivot upsert for CIKs {cik_batch[0]}...{cik_batch[-1]}: {e}")
+        if connection: connection.rollback()
+        return 0, 1
+    finally:
+        if cursor: cursor.close()
+
+# --- CIK Batch Processing ---
+def batch_result(cik_batch: List[int], failed: int = 0) -> Dict[str, Any]:
+    return {'ciks': len(cik_batch), 'first_cik': cik_batch[0], 'last_cik': cik_batch[-1], 'periods': 0, 'errors': 0, 'failed': failed,
+            'seconds': dict.fromkeys(('fetch', 'transform', 'upsert'), 0.0)}
+
+def process_cik_batch(connection, cik_batch: List[int], write_slot: Any = None, engine: str = DEFAULT_ENGINE) -> Dict[str, Any]:
+    """ Fetch -> pivot -> upsert for one CIK batch, piece by piece within FETCH_MAX_ROWS (engine 'sql': one INSERT ... SELECT, timed as upsert).
+    write_slot (a semaphore shared by the workers) is held only around the upsert. Returns counts and
+    per-stage seconds for the progress summary. """
+    result = batch_result(cik_batch)
+    if engine == 'sql':
+        t0 = time.time()
+        with write_slot or nullcontext(): result['periods'], result['failed'] = upsert_periods_in_db(connection, cik_batch)
+        result['seconds']['upsert'] = time.time() - t0
+        return result
+    # Plan fetch pieces within FETCH_MAX_ROWS, then fetch -> pivot -> upsert each piece in turn
+    t0 = time.time(); counts = count_facts_by_date(connection, cik_batch); result['seconds']['fetch'] += time.time() - t0
+    if counts is None: result['failed'] = 1; return result # Retried by the next run (watermark not advanced)
+    if not counts: logger.warning(f"No data fetched for CIK batch, skipping transformation."); return result # Count as processed even if no data
+    pieces = plan_fetch_pieces(counts)
+    if len(pieces) > 1: logger.info(f"CIK batch {cik_batch[0]}...{cik_batch[-1]}: {sum(c for _, _, c in counts)} facts fetched in {len(pieces)} pieces of at most {FETCH_MAX_ROWS}.")
+    for piece_ciks, ddate_range in pieces:
+        t0 = time.time(); raw_data_df = fetch_data_for_ciks(connection, piece_ciks, ddate_range); result['seconds']['fetch'] += time.time() - t0
+
+        if raw_data_df is None: result['failed'] = 1; continue # Fetch error: retried by the next run (watermark not advanced)
+        if raw_data_df.empty:
+            logger.warning(f"No data fetched for CIK batch, skipping transformation.")
+            continue
+
+        # Transform data (pivot, map tags, calculate FCF)
+        t0 = time.time(); period_data_df = transform_data(raw_data_df); result['seconds']['transform'] += time.time() - t0
+        del raw_data_df # Free memory
+
+        if period_data_df is None or period_data_df.empty:
+            logger.warning(f"Transformation yielded no data for CIK batch, skipping upsert.")
+            continue
+
+        # Upsert transformed data
+        t0 = time.time()
+        with write_slot or nullcontext(): periods, errors = upsert_period_data(connection, period_data_df)
+        result['periods'] += periods; result['errors'] += errors
+        result['seconds']['upsert'] += time.time() - t0
+    return result
+
+_db_write_slots = None # Shared BoundedSemaphore, set in each worker process
+_worker_connection = None # One DB connection per worker process, reused for all its batches
+
+def _init_worker(write_slots) -> None:
+    global _db_write_slots
+    _db_write_slots = write_slots
+
+def transform_cik_batch(cik_batch: List[int], engine: str = DEFAULT_ENGINE) -> Dict[str, Any]:
+    """ Runs one CIK batch in a pool worker on the worker's own connection. """
+    global _worker_connection
+    if _worker_connection is None or not _worker_connection.is_connected():
+        _worker_connection = create_db_connection()
+        if _worker_connection is None: return batch_result(cik_batch, failed=1)
+        multiprocessing.util.Finalize(_worker_connection, _worker_connection.close, exitpriority=10) # Closed when the worker exits
+    return process_cik_batch(_worker_connection, cik_batch, _db_write_slots, engine)
+
+def run_cik_batches(batches: List[List[int]], workers: int, max_db_writers: int, connection, engine: str = DEFAULT_ENGINE):
+    """ Yields process_cik_batch results as batches finish: in order on `connection` for one worker,
+    otherwise from a process pool (batches handed out one at a time, so faster workers take more). """
+    if workers <= 1:
+        for number, cik_batch in enumerate(batches, start=1):
+            logger.info(f"--- Processing CIK Batch {number}/{len(batches)} (CIKs {cik_batch[0]}...{cik_batch[-1]}) ---")
+            yield process_cik_batch(connection, cik_batch, engine=engine)
+        return
+    write_slots = multiprocessing.BoundedSemaphore(max_db_writers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(write_slots,)) as pool:
+        futures = {pool.submit(transform_cik_batch, cik_batch, engine): cik_batch for cik_batch in batches}
+        try:
+            for future in as_completed(futures):
+                cik_batch = futures[future]
+                try: yield future.result()
+                except Exception as e:
+                    logger.error(f"Worker failed on CIK batch {cik_batch[0]}...{cik_batch[-1]}: {e!r}")
+                    yield batch_result(cik_batch, failed=1)
+        finally:
+            for future in futures: future.cancel() # Stop handing out batches after an interrupt/error
+
 # --- Main Execution ---
 def main():
     parser = argparse.ArgumentParser(description="Transform SEC numeric data to periodic format.")
     # No directory needed if reading from DB
     # parser.add_argument("-d", "--data-dir", required=True, help="Path to the directory containing sub.txt and num.txt")
-    # args = parser.parse_args()
-    # data_directory = args.data_dir
+    parser.add_argument("--full", action="store_true", help=f"Re-transform every CIK instead of only those whose facts changed since the watermark in {TRANSFORM_STATE_TABLE}")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Processes transforming CIK batches in parallel, each with its own DB connection. Default: {DEFAULT_WORKERS}")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE, help=f"'pandas' = fetch facts and pivot in Python, 'sql' = pivot inside MariaDB with one INSERT ... SELECT per CIK batch. Default: {DEFAULT_ENGINE}")
+    parser.add_argument("--max-db-writers", type=int, default=DEFAULT_MAX_DB_WRITERS, help=f"Max workers upserting into {TARGET_TABLE} at the same time. Default: {DEFAULT_MAX_DB_WRITERS}")
+    args = parser.parse_args()
+    if args.workers < 1 or args.max_db_writers < 1: parser.error("--workers and --max-db-writers must be at least 1")
 
     start_time = time.time()
     logger.info("==================================================")
     logger.info(f"=== Starting SEC Data Transformation to Periods ===")
     logger.info(f"Source Table: {SOURCE_TABLE}")
     logger.info(f"Target Table: {TARGET_TABLE}")
-    logger.info(f"CIK Batch Size: {CIK_BATCH_SIZE}")
+    logger.info(f"CIK Batch Size: {CIK_BATCH_SIZE}, Engine: {args.engine}" + (" (period counts are MariaDB affected rows: 1 per new, 2 per updated period)" if args.engine == 'sql' else ""))
     logger.info("==================================================")
 
     db_connection = create_db_connection()
@@ -370,44 +686,53 @@ def main():
     total_processed_periods = 0
     total_db_errors = 0
     processed_cik_count = 0
+    failed_batches = 0
 
     try:
-        # 1. Get list of CIKs to process
-        ciks = get_ciks_to_process(db_connection)
-        if not ciks: logger.warning("No CIKs found to process."); return
+        # 1. Get list of CIKs to process: all (--full / first run) or those changed since the watermark
+        run_started_at = datetime.now()
+        state = read_transform_state(db_connection)
+        new_watermark = get_source_watermark(db_connection)
+        previous_watermark = state['watermark'] if state else None
+        incremental = not args.full and previous_watermark is not None
+        logger.info(f"Mode: {'incremental since ' + str(previous_watermark) if incremental else 'full'} (source watermark now {new_watermark})")
+        ciks = get_ciks_to_process(db_connection, previous_watermark - WATERMARK_OVERLAP, new_watermark) if incremental else get_ciks_to_process(db_connection)
+        db_connection.rollback() # End the read snapshot of the state/watermark/CIK queries; it must not stay open for the whole run
+        if ciks is None: logger.critical("Could not determine the CIKs to process. Watermark left unchanged."); return
+        if not ciks:
+            logger.info("No CIKs with changed facts to process." if incremental else "No CIKs found to process.")
+            if new_watermark is not None:
+                db_connection, saved = save_watermark(db_connection, watermark=new_watermark, mode='incremental' if incremental else 'full', ciks_processed=0, periods_upserted=0, started_at=run_started_at, finished_at=datetime.now())
+                if saved: logger.info(f"Watermark advanced to {new_watermark}.")
+            return
         total_ciks = len(ciks)
         logger.info(f"Will process data for {total_ciks} CIKs.")
 
-        # 2. Process CIKs in batches
-        for i in range(0, total_ciks, CIK_BATCH_SIZE):
-            cik_batch = ciks[i : i + CIK_BATCH_SIZE]
-            logger.info(f"--- Processing CIK Batch {i//CIK_BATCH_SIZE + 1}/{(total_ciks + CIK_BATCH_SIZE - 1)//CIK_BATCH_SIZE} (CIKs {cik_batch[0]}...{cik_batch[-1]}) ---")
-
-            # Fetch raw data for this batch
-            raw_data_df = fetch_data_for_ciks(db_connection, cik_batch)
-
-            if raw_data_df is None or raw_data_df.empty:
-                logger.warning(f"No data fetched for CIK batch, skipping transformation.")
-                processed_cik_count += len(cik_batch) # Count as processed even if no data
-                continue
-
-            # Transform data (pivot, map tags, calculate FCF)
-            period_data_df = transform_data(raw_data_df)
-            del raw_data_df # Free memory
-
-            if period_data_df is None or period_data_df.empty:
-                logger.warning(f"Transformation yielded no data for CIK batch, skipping upsert.")
-                processed_cik_count += len(cik_batch)
-                continue
-
-            # Upsert transformed data
-            processed, errors = upsert_period_data(db_connection, period_data_df)
-            total_processed_periods += processed
-            total_db_errors += errors
-            processed_cik_count += len(cik_batch) # Count CIKs whose data was attempted to be upserted
-
-            # Optional delay between CIK batches
-            # time.sleep(0.5)
+        # 2. Process CIKs in batches (in this process, or spread over --workers processes)
+        batches = [ciks[i : i + CIK_BATCH_SIZE] for i in range(0, total_ciks, CIK_BATCH_SIZE)]
+        workers = min(args.workers, len(batches))
+        stage_seconds = dict.fromkeys(('fetch', 'transform', 'upsert'), 0.0)
+        if workers > 1: logger.info(f"Using {workers} worker processes, at most {args.max_db_writers} upserting into {TARGET_TABLE} at once.")
+        for done, result in enumerate(run_cik_batches(batches, workers, args.max_db_writers, db_connection, args.engine), start=1):
+            processed_cik_count += result['ciks']
+            total_processed_periods += result['periods']
+            total_db_errors += result['errors']
+            failed_batches += result['failed']
+            for stage in stage_seconds: stage_seconds[stage] += result['seconds'][stage]
+            elapsed = time.time() - start_time
+            logger.info(f"[{done}/{len(batches)} batches] CIKs {result['first_cik']}...{result['last_cik']}: {result['periods']} periods, {result['errors']} errors"
+                        f"{' (FAILED)' if result['failed'] else ''} | total {processed_cik_count}/{total_ciks} CIKs, {total_processed_periods} periods, "
+                        f"{processed_cik_count / elapsed if elapsed else 0:.1f} CIKs/s")
+        logger.info(f"Stage times summed over workers: fetch {stage_seconds['fetch']:.1f}s, transform {stage_seconds['transform']:.1f}s, upsert {stage_seconds['upsert']:.1f}s")
+
+        # 3. Advance the watermark only if every batch went through, so failed CIKs are picked up again
+        if failed_batches or total_db_errors:
+            logger.warning(f"{failed_batches} CIK batch(es) failed to fetch, {total_db_errors} period records failed. Watermark left at {previous_watermark}.")
+        else:
+            db_connection, saved = save_watermark(db_connection, watermark=new_watermark, mode='incremental' if incremental else 'full', ciks_processed=processed_cik_count,
+                                                  periods_upserted=total_processed_periods, started_at=run_started_at, finished_at=datetime.now())
+            if saved: logger.info(f"Watermark advanced to {new_watermark}.")
+            else: logger.warning(f"Watermark NOT advanced (still {previous_watermark}); the next run re-transforms these CIKs.")
 
 
     except KeyboardInterrupt: logger.warning("Keyboard interrupt received.")